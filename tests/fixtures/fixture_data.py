@@ -5,6 +5,12 @@ from mixer.backend.django import mixer as _mixer
 from posts.models import Post, Group
 
 
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # Фоновые потоки дописывали бы миниатюры после удаления MEDIA_ROOT.
+    settings.THUMBNAIL_WORKERS = 0
+
+
 @pytest.fixture()
 def mock_media(settings):
     with tempfile.TemporaryDirectory() as temp_directory:
@@ -0,0 +1,30 @@
+from django.template.backends.django import DjangoTemplates, Template
+from sorl.thumbnail.base import ThumbnailBackend
+
+from .timing import measure
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with measure('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, засекающий время рендера для Server-Timing."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
+
+
+class TimedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, засекающий поиск и создание миниатюр."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        with measure('thumbnail'):
+            return super().get_thumbnail(file_, geometry_string, **options)
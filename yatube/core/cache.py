@@ -0,0 +1,468 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_started
+
+from .lru import LRUCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB, expires REAL,'
+    ' accessed REAL NOT NULL, size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    # Число записей и их объём ведут триггеры: проверка бюджета
+    # при записи — одна строка, а не SUM по всей таблице.
+    'CREATE TABLE IF NOT EXISTS cache_stats ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+    ' entries INTEGER NOT NULL, size INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE cache_stats SET entries = entries + 1, size = size + NEW.size;'
+    ' END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE cache_stats SET entries = entries - 1, size = size - OLD.size;'
+    ' END',
+    'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache'
+    ' BEGIN UPDATE cache_stats SET size = size + NEW.size - OLD.size; END',
+)
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed, size)'
+    ' VALUES (?, ?, ?, ?, ?)'
+    ' ON CONFLICT (key) DO UPDATE SET value = excluded.value,'
+    ' expires = excluded.expires, accessed = excluded.accessed,'
+    ' size = excluded.size'
+)
+# Столько ключей подставляется в один IN: меньше лимита параметров SQLite.
+BATCH_SIZE = 500
+# Время последнего чтения обновляется не чаще, чем раз в столько секунд:
+# для порядка вытеснения точнее не нужно, а запись дороже чтения.
+LRU_RESOLUTION = 1.0
+INT_RANGE = range(-2 ** 63, 2 ** 63)
+# Журнал изменённых ключей в L2: счётчик и ключ под каждым номером.
+INVALIDATION_HEAD = 'l1_invalidation_head'
+INVALIDATION_KEY = 'l1_invalidation:{}'
+# Эти значения в L1 отдаются как есть, остальные — копией из pickle:
+# вызывающий код вправе менять полученный объект, например ответ.
+IMMUTABLE_TYPES = (bool, int, float, str, bytes)
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов на машине.
+
+    База открыта в режиме WAL: чтения не ждут записей, а записи
+    разных процессов упорядочивает блокировка SQLite. Целые числа
+    хранятся как INTEGER, поэтому ``incr`` атомарен между процессами.
+    Кроме MAX_ENTRIES, объём ограничивается опцией MAX_SIZE в байтах;
+    при превышении вытесняются давно не читанные записи.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = os.path.abspath(location)
+        self._max_size = int(options.get('MAX_SIZE', 64 * 2 ** 20))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    def _db(self):
+        # После fork соединение родителя использовать нельзя.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            db = sqlite3.connect(self._path, timeout=self._busy_timeout,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            with self._write(db):
+                for statement in SCHEMA:
+                    db.execute(statement)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    @contextmanager
+    def _write(self, db):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _encode(self, value):
+        if type(value) is int and value in INT_RANGE:
+            return value, 8
+        data = pickle.dumps(value, self.pickle_protocol)
+        return data, len(data)
+
+    def _decode(self, value):
+        return pickle.loads(value) if isinstance(value, bytes) else value
+
+    def _row(self, key, value, timeout, now):
+        value, size = self._encode(value)
+        return key, value, self.get_backend_timeout(timeout), now, size
+
+    def _cull(self, db, now):
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        while entries > self._max_entries or size > self._max_size:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache'
+                ' ORDER BY accessed LIMIT ?)',
+                (max(entries // self._cull_frequency, 1),))
+            entries, size = db.execute(
+                'SELECT entries, size FROM cache_stats').fetchone()
+
+    def _fetch(self, keys, now):
+        """Живые записи по ключам со сроками; отмечает их чтение для LRU."""
+        db = self._db()
+        found = {}
+        stale = []
+        for start in range(0, len(keys), BATCH_SIZE):
+            chunk = keys[start:start + BATCH_SIZE]
+            rows = db.execute(
+                'SELECT key, value, expires, accessed FROM cache'
+                ' WHERE key IN (%s)' % ', '.join('?' * len(chunk)), chunk)
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = (value, expires)
+                if now - accessed > LRU_RESOLUTION:
+                    stale.append((now, key))
+        if stale:
+            db.executemany('UPDATE cache SET accessed = ? WHERE key = ?',
+                           stale)
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._fetch([key], time.time())
+        if key not in found:
+            return default
+        return self._decode(found[key][0])
+
+    def get_many(self, keys, version=None):
+        return {key: value for key, (value, expires)
+                in self.get_many_with_expiry(keys, version).items()}
+
+    def get_many_with_expiry(self, keys, version=None):
+        """Как ``get_many``, но ``{ключ: (значение, срок по time.time()
+        или None)}``: по сроку TieredCache ограничивает жизнь копии в L1.
+        """
+        keys = {self._key(key, version): key for key in keys}
+        found = self._fetch(list(keys), time.time())
+        return {keys[key]: (self._decode(value), expires)
+                for key, (value, expires) in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db().execute('SELECT expires FROM cache WHERE key = ?',
+                                 (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [self._row(self._key(key, version), value, timeout, now)
+                for key, value in data.items()]
+        db = self._db()
+        with self._write(db):
+            db.executemany(UPSERT, rows)
+            self._cull(db, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        row = self._row(self._key(key, version), value, timeout, now)
+        db = self._db()
+        with self._write(db):
+            # Занятый ключ перезаписывается, только если запись истекла.
+            added = db.execute(UPSERT + ' WHERE cache.expires <= ?',
+                               (*row, now)).rowcount
+            self._cull(db, now)
+        return added == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db()
+        with self._write(db):
+            touched = db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, now)).rowcount
+        return touched == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db()
+        with self._write(db):
+            row = db.execute('SELECT value, expires FROM cache WHERE key = ?',
+                             (key,)).fetchone()
+            if row is None or row[1] is not None and row[1] <= now:
+                raise ValueError("Key '%s' not found" % key)
+            value, size = self._encode(self._decode(row[0]) + delta)
+            db.execute('UPDATE cache SET value = ?, size = ?, accessed = ?'
+                       ' WHERE key = ?', (value, size, now, key))
+        return self._decode(value)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [(self._key(key, version),) for key in keys]
+        db = self._db()
+        with self._write(db):
+            db.executemany('DELETE FROM cache WHERE key = ?', keys)
+
+    def clear(self):
+        db = self._db()
+        with self._write(db):
+            db.execute('DELETE FROM cache')
+
+
+class _Tier:
+    """Общее для потоков процесса L1 одного L2 и его место в журнале."""
+
+    def __init__(self, max_entries):
+        self.entries = LRUCache(max_entries)
+        self.lock = threading.Lock()
+        self.position = None
+        self.synced_at = 0.0
+        self.stale = True
+        self.stats = dict.fromkeys(
+            ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0)
+
+    def count(self, name, number=1):
+        with self.lock:
+            self.stats[name] += number
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def mark_tiers_stale(**kwargs):
+    # Каждый запрос сверяет L1 с журналом перед первым чтением.
+    for tier in list(_tiers.values()):
+        tier.stale = True
+
+
+class TieredCache(BaseCache):
+    """Небольшой L1 в памяти процесса перед любым кэшем Django (L2).
+
+    LOCATION — псевдоним L2 в ``settings.CACHES``. Чтение сначала
+    идёт в L1, промахи — в L2 и оседают в L1 не дольше L1_TIMEOUT
+    секунд и не дольше срока в L2, если L2 его сообщает
+    (``get_many_with_expiry``); иначе копия может пережить запись в L2
+    на L1_TIMEOUT. Каждая запись через кэш отмечает ключ в журнале в L2;
+    перед первым чтением в запросе (и не реже раза в SYNC_INTERVAL
+    секунд вне запросов) процесс вычитывает журнал с прошлой сверки
+    и выбрасывает из L1 изменённые ключи. Если журнал ушёл дальше
+    LOG_SIZE записей или его часть потеряна, L1 очищается целиком.
+
+    Ключи с префиксами из L2_ONLY_PREFIXES (блокировки, которые только
+    берут и снимают) в L1 не попадают и журнал не пополняют.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = location
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        self._log_size = int(options.get('LOG_SIZE', 1000))
+        self._log_timeout = self._l1_timeout + self._sync_interval + 60
+        self._l2_only = tuple(options.get('L2_ONLY_PREFIXES', ()))
+        with _tiers_lock:
+            if location not in _tiers:
+                _tiers[location] = _Tier(
+                    int(options.get('L1_MAX_ENTRIES', 300)))
+        self._tier = _tiers[location]
+        request_started.connect(mark_tiers_stale,
+                                dispatch_uid='core.cache.mark_tiers_stale')
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def stats(self):
+        """Попадания и промахи по уровням с запуска процесса."""
+        with self._tier.lock:
+            return dict(self._tier.stats)
+
+    def _sync(self):
+        tier = self._tier
+        now = time.monotonic()
+        if not tier.stale and now - tier.synced_at < self._sync_interval:
+            return
+        tier.stale = False
+        tier.synced_at = now
+        head = self.l2.get(INVALIDATION_HEAD, 0)
+        position, tier.position = tier.position, head
+        if position is None or position == head:
+            return
+        if not 0 < head - position <= self._log_size:
+            tier.entries.clear()
+            return
+        log = self.l2.get_many([INVALIDATION_KEY.format(number)
+                                for number in range(position + 1, head + 1)])
+        if len(log) < head - position:
+            # Запись журнала вытеснена или ещё не дописана.
+            tier.entries.clear()
+            return
+        for key in log.values():
+            tier.entries.delete(key)
+
+    def _invalidate(self, keys):
+        """Выбросить ключи из своего L1 и отметить их в журнале."""
+        if not keys:
+            return
+        for key in keys:
+            self._tier.entries.delete(key)
+        l2 = self.l2
+        try:
+            head = l2.incr(INVALIDATION_HEAD, len(keys))
+        except ValueError:
+            # Счётчик начинается с текущего времени в микросекундах:
+            # если его вытеснят, новый окажется далеко впереди старых
+            # позиций, и процессы очистят L1, а не пропустят записи.
+            l2.add(INVALIDATION_HEAD, int(time.time() * 10 ** 6), None)
+            head = l2.incr(INVALIDATION_HEAD, len(keys))
+        l2.set_many({INVALIDATION_KEY.format(head - number): key
+                     for number, key in enumerate(keys)},
+                    self._log_timeout)
+
+    def _in_l1(self, key):
+        return not key.startswith(self._l2_only)
+
+    def _remember(self, key, value, expires=None):
+        timeout = self._l1_timeout
+        if expires is not None:
+            timeout = min(timeout, expires - time.time())
+            if timeout <= 0:
+                return
+        if isinstance(value, IMMUTABLE_TYPES):
+            entry = (value, False)
+        else:
+            entry = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), True)
+        self._tier.entries.set(key, (*entry, time.monotonic() + timeout))
+
+    def _fetch_l2(self, names, version):
+        """Значения из L2 со сроками, если L2 их сообщает."""
+        l2 = self.l2
+        if hasattr(l2, 'get_many_with_expiry'):
+            return l2.get_many_with_expiry(names, version=version)
+        return {name: (value, None) for name, value
+                in l2.get_many(names, version=version).items()}
+
+    def _recall(self, keys):
+        found = {}
+        for key in keys:
+            entry = self._tier.entries.get(key)
+            if entry is None:
+                continue
+            value, pickled, expires = entry
+            if expires <= time.monotonic():
+                self._tier.entries.delete(key)
+                continue
+            found[key] = pickle.loads(value) if pickled else value
+        return found
+
+    def get(self, key, default=None, version=None):
+        value = self.get_many([key], version).get(key)
+        return default if value is None else value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        l2 = self.l2
+        keys = {l2.make_key(key, version=version): key for key in keys}
+        found = self._recall(keys)
+        self._tier.count('l1_hits', len(found))
+        missing = {key: name for key, name in keys.items()
+                   if key not in found}
+        if missing:
+            self._tier.count('l1_misses', len(missing))
+            fetched = self._fetch_l2(list(missing.values()), version)
+            self._tier.count('l2_hits', len(fetched))
+            self._tier.count('l2_misses', len(missing) - len(fetched))
+            for key, name in missing.items():
+                if name in fetched:
+                    found[key], expires = fetched[name]
+                    if self._in_l1(name):
+                        self._remember(key, found[key], expires)
+        return {keys[key]: value for key, value in found.items()}
+
+    def has_key(self, key, version=None):
+        self._sync()
+        if self._recall([self.l2.make_key(key, version=version)]):
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        l2 = self.l2
+        failed = l2.set_many(data, timeout, version=version)
+        self._invalidate([l2.make_key(key, version=version)
+                          for key in data if self._in_l1(key)])
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added and self._in_l1(key):
+            # В L1 могла остаться копия записи, истёкшей в L2.
+            self._invalidate([self.l2.make_key(key, version=version)])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        if self._in_l1(key):
+            self._invalidate([self.l2.make_key(key, version=version)])
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self._invalidate([self.l2.make_key(key, version=version)
+                          for key in keys if self._in_l1(key)])
+
+    def clear(self):
+        self.l2.clear()
+        self._tier.entries.clear()
+        # Новый счётчик журнала далеко впереди: остальные процессы
+        # очистят свой L1 при следующей сверке.
+        self._tier.position = None
+        self.l2.add(INVALIDATION_HEAD, int(time.time() * 10 ** 6), None)
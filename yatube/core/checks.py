@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Блокировки миниатюр и пересборок, счётчики лент и поколения
+    страниц общие для процессов, только если общий и кэш.
+    """
+    if settings.CACHES['default']['BACKEND'] != LOCAL_CACHE_BACKEND:
+        return []
+    return [Warning(
+        'Кэш по умолчанию у каждого процесса свой.',
+        hint=('Задайте CACHE_LOCATION: иначе процессы рендерят одни и те '
+              'же миниатюры и не видят изменений, сделанных другими.'),
+        id='core.W001',
+    )]
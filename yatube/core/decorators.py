@@ -0,0 +1,8 @@
+def cacheable_page(view):
+    """Разрешить PageCacheMiddleware хранить страницы представления.
+
+    Представление само сообщает, из каких поколений собрана страница
+    (``request.page_dependencies``); остальные кэш страниц не трогает.
+    """
+    view.cacheable_page = True
+    return view
@@ -0,0 +1,6 @@
+from .holes import fragment
+
+
+@fragment('nav_user', 'includes/nav_user.html')
+def nav_user(request, view=''):
+    return {'view_name': view}
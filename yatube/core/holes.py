@@ -0,0 +1,67 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.http import quote_etag
+
+HOLE_MARK = b'<!--hole:'
+# Текст из базы выводится с экранированием, поэтому подделать метку
+# в посте или комментарии нельзя.
+HOLE_RE = re.compile(r'<!--hole:(?P<name>[\w-]+)\?(?P<params>[^<>]*?)-->')
+
+_fragments = {}
+
+
+def fragment(name, template_name):
+    """Зарегистрировать функцию, собирающую контекст вставки ``name``.
+
+    Функция получает запрос и параметры метки строками.
+    """
+    def decorator(get_context):
+        _fragments[name] = (template_name, get_context)
+        return get_context
+    return decorator
+
+
+def placeholder(name, **params):
+    """Метка на месте зависящей от пользователя части страницы.
+
+    Страница с метками одна на всех и кэшируется целиком, а метки
+    заполняются под текущего пользователя перед отдачей ответа.
+    """
+    return f'<!--hole:{name}?{urlencode(params)}-->'
+
+
+def render_fragment(request, name, params):
+    template_name, get_context = _fragments[name]
+    return render_to_string(template_name, get_context(request, **params),
+                            request=request)
+
+
+def fill_holes(request, response):
+    """Заполнить метки ответа вставками для пользователя запроса."""
+    if response.streaming or HOLE_MARK not in response.content:
+        return response
+    content = response.content.decode(response.charset)
+    response.content = HOLE_RE.sub(
+        lambda match: render_fragment(request, match['name'],
+                                      dict(parse_qsl(match['params']))),
+        content,
+    )
+    return response
+
+
+def personal_etag(request, dependencies):
+    """ETag страницы: версия общей части и то, чем заполнены вставки.
+
+    Вставки зависят от пользователя и CSRF-токена формы комментария.
+    """
+    user = request.user
+    parts = [
+        *map(str, dependencies.values()),
+        str(user.pk), user.get_username(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import SQLiteCache
+
+COUNTER_KEY = 'bench_counter'
+
+
+def count_in_worker(path, increments):
+    cache = SQLiteCache(path, {})
+    for _ in range(increments):
+        cache.incr(COUNTER_KEY)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает SQLiteCache с LocMemCache и FileBasedCache на '
+            'set, get, get_many и incr и проверяет, что incr из разных '
+            'процессов не теряет обновлений.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=2000,
+                            help='Операций каждого вида на бэкенд.')
+        parser.add_argument('--value-size', type=int, default=2048,
+                            help='Размер значения в байтах.')
+        parser.add_argument('--batch', type=int, default=10,
+                            help='Ключей в одном get_many.')
+        parser.add_argument('--processes', type=int, default=4,
+                            help='Процессов в проверке общего incr.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            params = {'OPTIONS': {'MAX_ENTRIES': options['operations'] * 2}}
+            backends = (
+                ('locmem', LocMemCache('bench_cache', params)),
+                ('file', FileBasedCache(os.path.join(tmp, 'files'), params)),
+                ('sqlite', SQLiteCache(os.path.join(tmp, 'cache.sqlite3'),
+                                       params)),
+            )
+            self.stdout.write(
+                f'{"бэкенд":>7} {"set мкс":>8} {"get мкс":>8} '
+                f'{"get_many мкс":>12} {"incr мкс":>9}')
+            for name, cache in backends:
+                timings = self.measure(cache, options)
+                self.stdout.write(
+                    f'{name:>7} ' + ' '.join(
+                        f'{timings[op]:>{width}.1f}' for op, width in
+                        (('set', 8), ('get', 8), ('get_many', 12),
+                         ('incr', 9))))
+            self.check_shared_incr(os.path.join(tmp, 'shared.sqlite3'),
+                                   options)
+
+    def timed(self, operations, action):
+        start = time.perf_counter()
+        for i in range(operations):
+            action(i)
+        return (time.perf_counter() - start) / operations * 10 ** 6
+
+    def measure(self, cache, options):
+        operations = options['operations']
+        value = 'x' * options['value_size']
+        keys = [f'bench_{i}' for i in range(operations)]
+        batch = options['batch']
+        cache.set(COUNTER_KEY, 0)
+        return {
+            'set': self.timed(operations,
+                              lambda i: cache.set(keys[i], value)),
+            'get': self.timed(operations, lambda i: cache.get(keys[i])),
+            'get_many': self.timed(
+                operations // batch,
+                lambda i: cache.get_many(keys[i * batch:(i + 1) * batch])),
+            'incr': self.timed(operations,
+                               lambda i: cache.incr(COUNTER_KEY)),
+        }
+
+    def check_shared_incr(self, path, options):
+        processes = options['processes']
+        increments = options['operations'] // processes
+        SQLiteCache(path, {}).set(COUNTER_KEY, 0)
+        workers = [
+            multiprocessing.Process(target=count_in_worker,
+                                    args=(path, increments))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        total = SQLiteCache(path, {}).get(COUNTER_KEY)
+        expected = processes * increments
+        if total != expected:
+            raise CommandError(
+                f'Общий счётчик: {total} вместо {expected}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{processes} процессов сделали {expected} incr '
+            f'без потерь.'))
@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+
+from .holes import fill_holes, personal_etag
+from .stampede import claim, is_fresh, is_stale, release, store
+from .timing import RequestTimings, activate, deactivate
+
+logger = logging.getLogger('yatube.timing')
+
+PAGE_CACHE_KEY = 'page:{}'
+
+
+class ServerTimingMiddleware:
+    """Время SQL, шаблонов и миниатюр в заголовке Server-Timing и в логе.
+
+    Включается для доли запросов SERVER_TIMING_SAMPLE_RATE или для
+    запроса с заголовком X-Server-Timing, равным SERVER_TIMING_TOKEN.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_enabled(self, request):
+        token = settings.SERVER_TIMING_TOKEN
+        header = request.META.get('HTTP_X_SERVER_TIMING', '')
+        if token and hmac.compare_digest(header.encode(), token.encode()):
+            return True
+        return random.random() < settings.SERVER_TIMING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.is_enabled(request):
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = activate(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+        total = time.perf_counter() - start
+        durations = {name: round(seconds * 1000, 2)
+                     for name, seconds in timings.durations.items()}
+        durations['total'] = round(total * 1000, 2)
+        response['Server-Timing'] = ', '.join(
+            [f'{name};dur={ms}' for name, ms in durations.items()]
+            + [f'queries;desc="{timings.sql_count} SQL queries"']
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.sql_count,
+            **{f'{name}_ms': ms for name, ms in durations.items()},
+        }))
+        return response
+
+
+class PageCacheMiddleware:
+    """Целые страницы для GET-запросов по пути и строке запроса.
+
+    Кэшируются только ответы представлений с ``@cacheable_page``,
+    указавших в
+    ``request.page_dependencies`` ключи и значения поколений, из которых
+    собрана страница. Запись отдаётся, пока ни одно из них не сдвинулось,
+    поэтому изменение поста, комментария или группы убирает из выдачи
+    ровно зависящие от них страницы. Устаревшую страницу пересобирает
+    один запрос, а параллельные ему получают прежнюю (core.stampede).
+
+    Части страницы, зависящие от пользователя, хранятся метками
+    ``{% hole %}``, так что одна запись обслуживает и анонимных,
+    и вошедших читателей: метки заполняются при каждой отдаче.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def cache_key(self, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return PAGE_CACHE_KEY.format(path)
+
+    def is_cacheable(self, request):
+        try:
+            match = resolve(request.path_info,
+                            getattr(request, 'urlconf', None))
+        except Resolver404:
+            return False
+        return getattr(match.func, 'cacheable_page', False)
+
+    def cached_entry(self, key):
+        """Запись кэша и текущие поколения, от которых она зависит."""
+        entry = cache.get(key)
+        if entry is None:
+            return None, None
+        return entry, cache.get_many(list(entry[0]))
+
+    def serve(self, request, entry):
+        dependencies, response = entry[0], entry[1]
+        etag = personal_etag(request, dependencies)
+        response['ETag'] = etag
+        return fill_holes(request, get_conditional_response(
+            request, etag=etag, response=response))
+
+    def store(self, key, request, response, duration):
+        dependencies = getattr(request, 'page_dependencies', None)
+        if (dependencies and request.method == 'GET'
+                and response.status_code == 200
+                and not response.streaming and not response.cookies):
+            store(key, response, settings.PAGE_CACHE_TIMEOUT,
+                  dependencies, duration)
+
+    def __call__(self, request):
+        if (request.method not in ('GET', 'HEAD')
+                or settings.PAGE_CACHE_TIMEOUT <= 0
+                or not self.is_cacheable(request)):
+            return fill_holes(request, self.get_response(request))
+        key = self.cache_key(request)
+        entry, version = self.cached_entry(key)
+        if entry is not None and is_fresh(entry, version):
+            return self.serve(request, entry)
+        claimed = claim(key)
+        if not claimed and is_stale(entry, version):
+            # Истёкшую страницу уже пересобирает другой запрос: пока
+            # отдаём прежнюю.
+            return self.serve(request, entry)
+        try:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            self.store(key, request, response, time.perf_counter() - start)
+        finally:
+            if claimed:
+                release(key)
+        return fill_holes(request, response)
@@ -0,0 +1,77 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+RECOMPUTE_LOCK_KEY = 'recompute:{}'
+
+
+def is_fresh(entry, version=None):
+    """Можно ли отдать запись, не пересчитывая её.
+
+    Запись устаревает со сменой версии, а незадолго до срока — случайно,
+    тем вероятнее, чем ближе срок и дольше пересчёт (XFetch): так запись
+    обновляет один из запросов, а не все разом в момент истечения.
+    """
+    entry_version, value, expires, duration = entry
+    if entry_version != version:
+        return False
+    if expires is None:
+        return True
+    early = (duration * settings.CACHE_EARLY_REFRESH_BETA
+             * -math.log(1 - random.random()))
+    return time.time() + early < expires
+
+
+def is_stale(entry, version=None):
+    """Можно ли отдать запись, пока её пересчитывает другой запрос.
+
+    Только истёкшую по сроку: после смены версии прежнее значение уже
+    не отражает изменений, и пользователь не увидит своей правки.
+    """
+    return entry is not None and entry[0] == version
+
+
+def claim(key):
+    """Взять право пересчитать запись; другие процессы пока отдают старую."""
+    return cache.add(RECOMPUTE_LOCK_KEY.format(key), True,
+                     settings.CACHE_RECOMPUTE_LOCK_TIMEOUT)
+
+
+def release(key):
+    cache.delete(RECOMPUTE_LOCK_KEY.format(key))
+
+
+def store(key, value, timeout, version=None, duration=0):
+    """Сохранить значение с версией; после срока оно живёт ещё
+    CACHE_STALE_TIMEOUT секунд, чтобы было что отдать во время пересчёта.
+    """
+    if timeout is None:
+        cache.set(key, (version, value, None, duration), None)
+    elif timeout > 0:
+        cache.set(key, (version, value, time.time() + timeout, duration),
+                  timeout + settings.CACHE_STALE_TIMEOUT)
+
+
+def get_or_set(key, compute, timeout, version=None):
+    """Значение из кэша или от ``compute()``, пересчитываемое одним запросом.
+
+    Пока истёкшая запись пересчитывается, остальные получают прежнее
+    значение. Без записи или со сменой версии значение считает каждый.
+    """
+    entry = cache.get(key)
+    if entry is not None and is_fresh(entry, version):
+        return entry[1]
+    claimed = claim(key)
+    if not claimed and is_stale(entry, version):
+        return entry[1]
+    try:
+        start = time.perf_counter()
+        value = compute()
+        store(key, value, timeout, version, time.perf_counter() - start)
+    finally:
+        if claimed:
+            release(key)
+    return value
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 их содержимого.
+
+    Одинаковые загрузки сохраняются один раз: имя файла зависит только
+    от байтов и расширения, каталог берётся из ``upload_to``.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        checksum = digest.hexdigest()
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, checksum[:2], checksum + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return self.write(name, content)
+
+    def write(self, name, content):
+        """Записать ``content`` ровно под именем ``name``."""
+        # Файл пишется под временным именем и атомарно переименовывается,
+        # чтобы параллельная загрузка тех же байтов не увидела его частично.
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя окончательно определяется в _save по содержимому.
+        return name
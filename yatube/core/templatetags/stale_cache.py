@@ -0,0 +1,47 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core.stampede import get_or_set
+
+register = template.Library()
+
+
+class StaleCacheNode(template.Node):
+
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on])
+        version = self.version.resolve(context) if self.version else None
+        return get_or_set(key, lambda: self.nodelist.render(context),
+                          None if timeout is None else float(timeout), version)
+
+
+@register.tag
+def stale_cache(parser, token):
+    """Как ``{% cache %}``, но без лавины пересчётов при истечении.
+
+    ``{% stale_cache timeout name [vary_on ...] [version=expr] %}``:
+    пока один запрос пересобирает истёкший фрагмент, остальные получают
+    прежний; после смены версии фрагмент пересобирается сразу.
+    """
+    nodelist = parser.parse(('endstale_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]!r} tag requires at least 2 arguments.')
+    version = None
+    if bits[-1].startswith('version='):
+        version = parser.compile_filter(bits.pop()[len('version='):])
+    return StaleCacheNode(
+        nodelist, parser.compile_filter(bits[1]), bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]], version)
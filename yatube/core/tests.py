@@ -0,0 +1,486 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+from .cache import INVALIDATION_HEAD, SQLiteCache, TieredCache, _Tier
+from .checks import check_shared_cache
+from .stampede import claim, get_or_set, is_fresh, release, store
+from .middleware import PageCacheMiddleware
+from .storage import ContentAddressedStorage
+
+
+class PageCacheMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='cached_author')
+        cls.group = Group.objects.create(title='Группа', slug='cached',
+                                         description='Описание')
+        cls.other_group = Group.objects.create(
+            title='Другая', slug='cached_other', description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=(self.group.slug,)),
+            'other_group': reverse('posts:group_list',
+                                   args=(self.other_group.slug,)),
+            'post': reverse('posts:post', args=(self.post.pk,)),
+        }
+
+    def is_cached(self, url, client=None):
+        # Из кэша страница приходит без отрисовки шаблонов, кроме вставок.
+        response = (client or self.client).get(url)
+        return 'base.html' not in [t.name for t in response.templates]
+
+    def warm_up(self):
+        for url in self.urls.values():
+            self.client.get(url)
+
+    def test_pages_are_cached(self):
+        self.warm_up()
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                with self.assertNumQueries(0):
+                    self.assertTrue(self.is_cached(url))
+        self.assertFalse(self.is_cached(self.urls['index'] + '?page=2'))
+
+    def test_users_share_pages_with_own_fragments(self):
+        self.warm_up()
+        reader = User.objects.create(username='cached_reader')
+        Follow.objects.create(user=reader, author=self.author)
+        profile = reverse('posts:profile', args=(self.author.username,))
+        self.client.get(profile)
+        self.client.force_login(self.author)
+        self.assertTrue(self.is_cached(self.urls['post']))
+        response = self.client.get(self.urls['post'])
+        self.assertContains(response, 'Пользователь: cached_author')
+        self.assertContains(response, 'редактировать запись')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+        reader_client = self.client_class()
+        reader_client.force_login(reader)
+        self.assertTrue(self.is_cached(self.urls['post'], reader_client))
+        response = reader_client.get(self.urls['post'])
+        self.assertContains(response, 'Пользователь: cached_reader')
+        self.assertNotContains(response, 'редактировать запись')
+        self.assertTrue(self.is_cached(profile, reader_client))
+        self.assertContains(reader_client.get(profile), 'Отписаться')
+        self.assertNotContains(self.client.get(profile), 'Отписаться')
+
+    def test_etag_differs_between_users(self):
+        etag = self.client.get(self.urls['index'])['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(self.urls['index'],
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_comment_purges_only_its_post(self):
+        self.warm_up()
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        self.assertFalse(self.is_cached(self.urls['post']))
+        self.assertTrue(self.is_cached(self.urls['index']))
+        self.assertTrue(self.is_cached(self.urls['group']))
+
+    def test_post_purges_its_feeds(self):
+        self.warm_up()
+        other_author = User.objects.create(username='other_author')
+        Post.objects.create(author=other_author, group=self.other_group,
+                            text='Новый пост')
+        self.assertFalse(self.is_cached(self.urls['index']))
+        self.assertFalse(self.is_cached(self.urls['other_group']))
+        self.assertTrue(self.is_cached(self.urls['group']))
+        self.assertTrue(self.is_cached(self.urls['post']))
+        response = self.client.get(self.urls['index'])
+        self.assertContains(response, 'Новый пост')
+
+    def test_only_marked_views_are_cacheable(self):
+        middleware = PageCacheMiddleware(None)
+        factory = RequestFactory()
+        for url, cacheable in (
+                (self.urls['index'], True),
+                (self.urls['post'], True),
+                (reverse('posts:search'), False),
+                (reverse('posts:follow_index'), False),
+                (reverse('admin:index'), False),
+                ('/missing/', False)):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    middleware.is_cacheable(factory.get(url)), cacheable)
+
+    def test_rename_refreshes_pages(self):
+        self.warm_up()
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Переименованный'
+        author.save()
+        for name in ('index', 'group', 'post'):
+            with self.subTest(name=name):
+                self.assertFalse(self.is_cached(self.urls[name]))
+                self.assertContains(self.client.get(self.urls[name]),
+                                    'Переименованный')
+        self.assertTrue(self.is_cached(self.urls['other_group']))
+
+    def test_cached_page_answers_conditional_get(self):
+        etag = self.client.get(self.urls['index'])['ETag']
+        response = self.client.get(self.urls['index'],
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(SERVER_TIMING_TOKEN='secret')
+class ServerTimingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_header_absent_by_default(self):
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_header_on_token(self):
+        with self.assertLogs('yatube.timing', 'INFO') as logs:
+            response = self.client.get('/', HTTP_X_SERVER_TIMING='secret')
+        header = response['Server-Timing']
+        for metric in ('sql;dur=', 'template;dur=', 'thumbnail;dur=',
+                       'total;dur=', 'queries;desc='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, header)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    def test_wrong_token_ignored(self):
+        response = self.client.get('/', HTTP_X_SERVER_TIMING='wrong')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled(self):
+        with self.assertLogs('yatube.timing', 'INFO'):
+            response = self.client.get('/about/tech/')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_identical_content_stored_once(self):
+        first = self.storage.save('posts/a.GIF', ContentFile(b'same'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'same'))
+        other = self.storage.save('posts/a.gif', ContentFile(b'other'))
+        checksum = hashlib.sha256(b'same').hexdigest()
+        self.assertEqual(first, f'posts/{checksum[:2]}/{checksum}.gif')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(
+            os.listdir(os.path.join(self.location, 'posts', checksum[:2])),
+            [f'{checksum}.gif'])
+
+
+class SQLiteCacheTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values_round_trip(self):
+        values = {'int': 7, 'text': 'текст', 'list': [1, {'a': None}],
+                  'bool': True, 'big': 2 ** 70}
+        self.cache.set_many(values)
+        self.assertEqual(self.cache.get_many([*values, 'missing']), values)
+        self.assertIs(self.cache.get('bool'), True)
+        self.cache.delete_many(['int', 'text'])
+        self.assertEqual(self.cache.get('int', 'default'), 'default')
+        self.assertFalse(self.cache.has_key('text'))
+
+    def test_expiry_add_and_touch(self):
+        self.cache.set('gone', 1, 0)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertTrue(self.cache.add('gone', 2))
+        self.assertFalse(self.cache.add('gone', 3))
+        self.assertEqual(self.cache.get('gone'), 2)
+        self.assertTrue(self.cache.touch('gone', 0))
+        self.assertFalse(self.cache.has_key('gone'))
+        self.assertFalse(self.cache.touch('gone'))
+
+    def test_incr_is_shared_between_instances(self):
+        other = self.make_cache()
+        self.cache.set('counter', 1)
+        self.assertEqual(other.incr('counter', 5), 6)
+        self.assertEqual(self.cache.decr('counter'), 5)
+        with self.assertRaises(ValueError):
+            other.incr('missing')
+
+    def test_least_recently_used_evicted_within_budget(self):
+        cache = self.make_cache(MAX_SIZE=10000, CULL_FREQUENCY=10)
+        value = 'x' * 900
+        for i in range(10):
+            cache.set(f'key_{i}', value)
+            # Прочитанный ключ свежее записанных после него.
+            cache._db().execute("UPDATE cache SET accessed = accessed - 100"
+                                " WHERE key != ':1:key_0'")
+        cache.set('key_10', value)
+        entries, size = cache._db().execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        self.assertLessEqual(size, 10000)
+        self.assertEqual(entries, len(cache._db().execute(
+            'SELECT key FROM cache').fetchall()))
+        self.assertIsNotNone(cache.get('key_0'))
+        self.assertIsNotNone(cache.get('key_10'))
+        self.assertIsNone(cache.get('key_1'))
+
+    def test_max_entries(self):
+        cache = self.make_cache(MAX_ENTRIES=5, CULL_FREQUENCY=2)
+        for i in range(20):
+            cache.set(f'key_{i}', i)
+        self.assertLessEqual(len(cache._db().execute(
+            'SELECT key FROM cache').fetchall()), 5)
+        self.assertEqual(cache.get('key_19'), 19)
+
+    def test_bench_cache_command(self):
+        out = StringIO()
+        call_command('bench_cache', operations=40, processes=2, stdout=out)
+        output = out.getvalue()
+        for backend in ('locmem', 'file', 'sqlite'):
+            self.assertIn(backend, output)
+        self.assertIn('40 incr без потерь', output)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+               'LOCATION': 'tiered-tests'},
+})
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.cache = self.make_worker()
+
+    def make_worker(self, **options):
+        worker = TieredCache('shared', {'OPTIONS': options})
+        # Свой L1, как у отдельного процесса.
+        worker._tier = _Tier(10)
+        return worker
+
+    def test_second_read_served_from_l1(self):
+        self.cache.set('page', {'html': 'старый'})
+        self.assertEqual(self.cache.get('page'), {'html': 'старый'})
+        caches['shared'].set('page', {'html': 'в обход журнала'})
+        page = self.cache.get('page')
+        self.assertEqual(page, {'html': 'старый'})
+        page['html'] = 'изменён вызывающим'
+        self.assertEqual(self.cache.get('page'), {'html': 'старый'})
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.stats(), {
+            'l1_hits': 2, 'l1_misses': 2, 'l2_hits': 1, 'l2_misses': 1})
+
+    def test_writes_invalidate_other_workers(self):
+        other = self.make_worker()
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(other.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        self.cache.incr('a')
+        self.cache.delete('b')
+        # Без нового запроса L1 сверяется не чаще SYNC_INTERVAL.
+        self.assertEqual(other.get('a'), 1)
+        other._tier.stale = True
+        self.assertEqual(other.get_many(['a', 'b']), {'a': 2})
+
+    def test_lost_log_clears_l1(self):
+        other = self.make_worker(LOG_SIZE=2)
+        self.cache.set_many({'a': 1, 'b': 2})
+        other.get_many(['a', 'b'])
+        for value in range(3):
+            self.cache.set('c', value)
+        caches['shared'].set('b', 3)
+        other._tier.stale = True
+        self.assertEqual(other.get_many(['a', 'b']), {'a': 1, 'b': 3})
+        self.assertEqual(other.stats()['l1_hits'], 0)
+        self.cache.clear()
+        other._tier.stale = True
+        self.assertIsNone(other.get('a'))
+
+    def test_l1_entries_expire(self):
+        cache = self.make_worker(L1_TIMEOUT=0)
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.stats()['l2_hits'], 2)
+
+    def test_l1_copy_lives_no_longer_than_l2(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        with override_settings(CACHES={'sqlite': {
+                'BACKEND': 'core.cache.SQLiteCache',
+                'LOCATION': os.path.join(tmp, 'cache.sqlite3')}}):
+            cache = TieredCache('sqlite', {})
+            cache._tier = _Tier(10)
+            cache.set('short', 'value', 0.05)
+            self.assertEqual(cache.get('short'), 'value')
+            time.sleep(0.1)
+            self.assertIsNone(cache.get('short'))
+
+    def test_lock_keys_bypass_l1_and_log(self):
+        cache = self.make_worker(L2_ONLY_PREFIXES=('lock:',))
+        cache.set('page', 'value')
+        head = caches['shared'].get(INVALIDATION_HEAD)
+        self.assertTrue(cache.add('lock:page', True))
+        self.assertTrue(cache.get('lock:page'))
+        cache.delete('lock:page')
+        self.assertEqual(caches['shared'].get(INVALIDATION_HEAD), head)
+        self.assertIsNone(cache.get('lock:page'))
+
+
+class StampedeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return f'значение {self.computed}'
+
+    def test_stale_value_served_while_recomputing(self):
+        cache.set('fragment', (1, 'старое', time.time() - 1, 0), 60)
+        self.assertTrue(claim('fragment'))
+        self.assertEqual(get_or_set('fragment', self.compute, 60, 1),
+                         'старое')
+        self.assertEqual(self.computed, 0)
+        release('fragment')
+        self.assertEqual(get_or_set('fragment', self.compute, 60, 1),
+                         'значение 1')
+        self.assertEqual(get_or_set('fragment', self.compute, 60, 1),
+                         'значение 1')
+        self.assertTrue(claim('fragment'))
+
+    def test_new_version_computed_while_recomputing(self):
+        store('fragment', 'старое', 60, version=1)
+        self.assertTrue(claim('fragment'))
+        self.assertEqual(get_or_set('fragment', self.compute, 60, 2),
+                         'значение 1')
+
+    def test_early_refresh(self):
+        entry = (1, 'значение', time.time() + 60, 1)
+        with override_settings(CACHE_EARLY_REFRESH_BETA=0):
+            self.assertTrue(is_fresh(entry, 1))
+            self.assertFalse(is_fresh(entry, 2))
+        with override_settings(CACHE_EARLY_REFRESH_BETA=10 ** 6):
+            self.assertFalse(is_fresh(entry, 1))
+
+    def test_page_served_stale_while_rebuilt(self):
+        url = reverse('posts:index')
+        with override_settings(PAGE_CACHE_TIMEOUT=0.01):
+            key = PageCacheMiddleware(None).cache_key(
+                self.client.get(url).wsgi_request)
+        time.sleep(0.02)
+        self.assertTrue(claim(key))
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        release(key)
+
+    def test_changed_page_rebuilt_despite_claim(self):
+        url = reverse('posts:index')
+        key = PageCacheMiddleware(None).cache_key(
+            self.client.get(url).wsgi_request)
+        Post.objects.create(author=User.objects.create(username='new'),
+                            text='Новый пост')
+        self.assertTrue(claim(key))
+        self.assertContains(self.client.get(url), 'Новый пост')
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0.2, FEED_IDS_TIMEOUT=0.2,
+                   POST_OBJECT_TIMEOUT=0.2)
+class StampedeLoadTests(TransactionTestCase):
+    """Нагрузка на страницу с истекающим кэшем из нескольких потоков."""
+    threads = 16
+    duration = 1.2
+    window = 0.2
+    query_time = 0.02
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='loaded')
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Пост {i}') for i in range(20))
+        self.url = reverse('posts:index')
+
+    def load(self, queries):
+        started = time.monotonic()
+
+        def count(execute, sql, params, many, context):
+            queries[int((time.monotonic() - started) / self.window)] += 1
+            # Медленная база: пока пересборка ждёт ответа, остальные
+            # потоки успевают прийти за той же страницей.
+            time.sleep(self.query_time)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            while time.monotonic() - started < self.duration:
+                self.client_class().get(self.url)
+                queries['requests'] += 1
+        connection.close()
+
+    def test_query_rate_flat_across_expirations(self):
+        with CaptureQueriesContext(connection) as rebuild:
+            self.client.get(self.url)
+        queries = Counter()
+        workers = [threading.Thread(target=self.load, args=(queries,))
+                   for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        requests = queries.pop('requests')
+        # За прогон страница истекает шесть раз, а запросов — сотни:
+        # без защиты на каждом истечении её пересобирал бы каждый поток.
+        self.assertGreater(requests, 10 * self.threads)
+        self.assertLessEqual(max(queries.values()),
+                             3 * len(rebuild.captured_queries))
+
+
+class ChecksTests(TestCase):
+
+    def test_local_cache_warned(self):
+        local = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'core.cache.TieredCache'}}
+        with override_settings(CACHES=local):
+            self.assertEqual([warning.id for warning in
+                              check_shared_cache(None)], ['core.W001'])
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
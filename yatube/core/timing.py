@@ -0,0 +1,49 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Счётчики одного запроса: SQL, шаблоны и миниатюры.
+
+    Экземпляр служит обёрткой для ``connection.execute_wrapper``.
+    """
+
+    def __init__(self):
+        self.sql_count = 0
+        self.durations = {'sql': 0.0, 'template': 0.0, 'thumbnail': 0.0}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.durations['sql'] += time.perf_counter() - start
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+
+def activate(timings):
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def measure(name):
+    """Прибавить время блока к счётчику ``name`` текущего запроса."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
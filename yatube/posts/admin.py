@@ -1,26 +1,52 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .paginators import EstimatedCountPaginator
+from .search import search_posts
+
+
+class FastChangeListAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*) и с оценкой числа строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(FastChangeListAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
+    # Сортировки, которые читаются из индекса post_date_idx.
+    sortable_by = ('pk', 'pub_date')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('author', 'group')
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по тому же индексу, что и /search/, а не LIKE по тексту.
+        if not search_term:
+            return queryset, False
+        matches = search_posts(search_term).values('pk')
+        return queryset.filter(pk__in=matches), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
+    search_fields = ('title', 'slug')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListAdmin):
     list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    sortable_by = ('pk', 'created')
+    autocomplete_fields = ('author', 'post')
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(FastChangeListAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
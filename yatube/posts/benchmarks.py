@@ -0,0 +1,127 @@
+import math
+import pickle
+import random
+import time
+import tracemalloc
+
+from django.db import connection
+
+from core.timing import RequestTimings
+
+from .counters import recount
+from .feeds import backfill_feed
+from .models import Comment, Follow, Group, Post, User
+
+BENCH_PREFIX = 'bench_'
+
+
+def percentile(values, pct):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(len(values) * pct / 100), 1)
+    return values[rank - 1]
+
+
+def seed_data(users, groups, posts, comments, follows, seed=0):
+    """Заполнить базу пользователями, группами, постами и подписками.
+
+    Записи создаются пачками, поэтому сигналы не срабатывают:
+    ленты подписок заполняются отдельно через ``backfill_feed``,
+    а счётчики — через ``recount``.
+    """
+    rng = random.Random(seed)
+    User.objects.bulk_create(
+        User(username=f'{BENCH_PREFIX}{i}') for i in range(users))
+    user_ids = list(User.objects.filter(username__startswith=BENCH_PREFIX)
+                    .values_list('pk', flat=True))
+    Group.objects.bulk_create(
+        Group(title=f'Группа {i}', slug=f'{BENCH_PREFIX}{i}',
+              description='Бенчмарк') for i in range(groups))
+    group_ids = list(Group.objects.filter(slug__startswith=BENCH_PREFIX)
+                     .values_list('pk', flat=True))
+    Post.objects.bulk_create(
+        Post(author_id=rng.choice(user_ids),
+             group_id=rng.choice(group_ids + [None]),
+             text=f'Пост {i} ' + 'текст ' * rng.randint(5, 50))
+        for i in range(posts))
+    post_ids = list(Post.objects.filter(author_id__in=user_ids)
+                    .values_list('pk', flat=True))
+    Comment.objects.bulk_create(
+        Comment(post_id=rng.choice(post_ids),
+                author_id=rng.choice(user_ids),
+                text=f'Комментарий {i}') for i in range(comments))
+    pairs = set()
+    for user_id in user_ids:
+        authors = [pk for pk in user_ids if pk != user_id]
+        for author_id in rng.sample(authors, min(follows, len(authors))):
+            pairs.add((user_id, author_id))
+    Follow.objects.bulk_create(
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id, author_id in pairs)
+    for user_id, author_id in pairs:
+        backfill_feed(user_id, author_id)
+    recount()
+    return user_ids, group_ids, post_ids
+
+
+def measure_requests(client, requests):
+    """Выполнить запросы ``(method, url, data)`` и собрать статистику.
+
+    Возвращает перцентили времени ответа в миллисекундах, среднее
+    число SQL-запросов и средний размер ответа в байтах.
+    """
+    timings = []
+    queries = 0
+    size = 0
+    for method, url, data in requests:
+        counter = RequestTimings()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries += counter.sql_count
+        size += len(response.content)
+    timings.sort()
+    count = len(timings)
+    return {
+        'requests': count,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': round(queries / count, 2),
+        'bytes': round(size / count),
+    }
+
+
+def measure_page_build(fetch, render, repeat):
+    """Замерить выборку постов ``fetch()`` и отрисовку ``render(posts)``.
+
+    Возвращает медианы времени выборки и отрисовки в миллисекундах,
+    память под выбранные посты и пик при выборке в КиБ и размер постов
+    в pickle, как в кэше, в КиБ.
+    """
+    fetch_ms = []
+    render_ms = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        posts = fetch()
+        fetched = time.perf_counter()
+        render(posts)
+        fetch_ms.append((fetched - start) * 1000)
+        render_ms.append((time.perf_counter() - fetched) * 1000)
+    fetch_ms.sort()
+    render_ms.sort()
+    tracemalloc.start()
+    try:
+        posts = fetch()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'fetch_ms': round(percentile(fetch_ms, 50), 3),
+        'render_ms': round(percentile(render_ms, 50), 3),
+        'retained_kib': round(retained / 1024, 1),
+        'peak_kib': round(peak / 1024, 1),
+        'pickled_kib': round(len(pickle.dumps(posts)) / 1024, 1),
+    }
@@ -0,0 +1,86 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def change_counters(queryset, **deltas):
+    """Атомарно сдвинуть счётчики строк выборки через F()."""
+    queryset.update(**{field: F(field) + delta
+                       for field, delta in deltas.items()})
+
+
+def change_user_stats(user_id, **deltas):
+    change_counters(UserStats.objects.filter(pk=user_id), **deltas)
+
+
+def change_group_posts(group_id, delta):
+    if group_id is not None:
+        change_counters(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def _count_of(queryset, field):
+    """Подзапрос с числом строк ``queryset``, сгруппированных по ``field``."""
+    counts = (queryset.filter(**{field: OuterRef('pk')})
+              .order_by().values(field)
+              .annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def user_counts(user_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def user_stats(user):
+    """Счётчики пользователя; недостающая строка пересчитывается и создаётся.
+
+    Ожидает пользователя, загруженного с ``select_related('stats')``.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(
+            user=user, defaults=user_counts(user.pk))
+        return stats
+
+
+def recount():
+    """Пересчитать все счётчики по данным.
+
+    Возвращает число разошедшихся строк по каждой модели.
+    """
+    posts = Post.objects.all()
+    follows = Follow.objects.all()
+    targets = (
+        (Group.objects.all(), {
+            'posts_count': _count_of(posts, 'group')}),
+        (Post.objects.all(), {
+            'comments_count': _count_of(Comment.objects.all(), 'post')}),
+        (UserStats.objects.all(), {
+            'posts_count': _count_of(posts, 'author'),
+            'followers_count': _count_of(follows, 'author'),
+            'following_count': _count_of(follows, 'user'),
+        }),
+    )
+    fixed = {}
+    for queryset, counts in targets:
+        in_sync = Q()
+        for field in counts:
+            in_sync &= Q(**{field: F(f'actual_{field}')})
+        fixed[queryset.model._meta.model_name] = (
+            queryset.annotate(**{f'actual_{field}': count
+                                 for field, count in counts.items()})
+            .exclude(in_sync).count()
+        )
+        queryset.update(**counts)
+    missing = list(User.objects.filter(stats__isnull=True)
+                   .values_list('pk', flat=True))
+    UserStats.objects.bulk_create(
+        UserStats(user_id=user_id, **user_counts(user_id))
+        for user_id in missing)
+    fixed[UserStats._meta.model_name] += len(missing)
+    return fixed
@@ -0,0 +1,417 @@
+import hashlib
+import heapq
+import time
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils.functional import cached_property
+
+from .models import FeedEntry, Follow, Post, PulledAuthor
+from .records import post_records
+
+# Обратно в раскладку автор возвращается с запасом, чтобы не «дребезжать»
+# на границе порога при каждой подписке и отписке.
+PUSH_BACK_RATIO = 0.9
+
+INDEX_FEED = 'index'
+# Поколение всех групп: ссылки на группы есть в каждой ленте.
+GROUPS_GENERATION = 'groups'
+GENERATION_KEY = 'feed_generation:{}'
+# Список id ленты под поколением её состава и запись поста для лент.
+FEED_IDS_KEY = 'feed_ids:{}:{}'
+POST_OBJECT_KEY = 'post_record:{}'
+
+
+def group_feed(group_id):
+    return f'group:{group_id}'
+
+
+def profile_feed(author_id):
+    return f'profile:{author_id}'
+
+
+def follow_feed(user_id):
+    """Лента подписок; её поколение меняется только с подписками."""
+    return f'follow:{user_id}'
+
+
+def followers_generation(author_id):
+    """Поколение подписчиков автора: от них зависят счётчик и кнопка."""
+    return f'followers:{author_id}'
+
+
+def with_feed_fields(posts):
+    """Подгрузить автора и группу тем же запросом и только нужные поля."""
+    return posts.select_related('author', 'group').only(
+        'text', 'pub_date', 'image',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__slug', 'group__title',
+    )
+
+
+def post_generation(post_id):
+    return f'post:{post_id}'
+
+
+def post_feeds(post):
+    """Общие ленты, в которых показывается пост (без лент подписок)."""
+    feeds = [INDEX_FEED, profile_feed(post.author_id)]
+    if post.group_id is not None:
+        feeds.append(group_feed(post.group_id))
+    return feeds
+
+
+def post_display_feeds(post):
+    """Все ленты и страницы, на которых показывается пост.
+
+    Ленты подписок сюда не входят: их версия складывается из поколений
+    авторов при чтении (``versioned_follow_feed``).
+    """
+    return post_feeds(post) + [post_generation(post.pk)]
+
+
+def author_display_feeds(author):
+    """Все ленты и страницы, на которых выводится имя пользователя:
+    его посты и посты с его комментариями.
+    """
+    posts = Post.objects.filter(
+        Q(author=author) | Q(comments__author=author)).distinct()
+    feeds = {INDEX_FEED, profile_feed(author.pk)}
+    for post_id, group_id in posts.values_list('pk', 'group_id'):
+        feeds.add(post_generation(post_id))
+        if group_id is not None:
+            feeds.add(group_feed(group_id))
+    return sorted(feeds)
+
+
+def new_generation():
+    # Начальное значение из часов: после вытеснения ключа счётчик
+    # не вернётся к номеру, под которым ещё лежат старые фрагменты.
+    return time.time_ns() // 1000
+
+
+def get_generations(feeds):
+    keys = [GENERATION_KEY.format(feed) for feed in feeds]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            generation = new_generation()
+            cache.add(key, generation, None)
+            found[key] = cache.get(key, generation)
+    return [found[key] for key in keys]
+
+
+def bump_generations(feeds):
+    """Сдвинуть поколения лент, чтобы их кэшированные фрагменты устарели."""
+    for feed in feeds:
+        key = GENERATION_KEY.format(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+
+
+def feed_cache_context(*feeds):
+    """Контекст для ``{% stale_cache %}``: лента, версия фрагмента
+    и время его жизни.
+    """
+    feeds = [*feeds, GROUPS_GENERATION]
+    generations = '.'.join(str(gen) for gen in get_generations(feeds))
+    return {
+        'feed_name': feeds[0],
+        'feed_version': f'{feeds[0]}:{generations}',
+        'feed_cache_timeout': settings.FEED_FRAGMENT_TIMEOUT,
+    }
+
+
+def feed_members(feed):
+    """Поколение состава ленты: меняется, только когда посты
+    появляются в ленте или уходят из неё, но не при их правке.
+    """
+    return f'members:{feed}'
+
+
+def author_posts(author_id):
+    """Поколение состава постов автора, из которых собираются
+    ленты его подписчиков.
+    """
+    return feed_members(profile_feed(author_id))
+
+
+def versioned_follow_feed(user_id, authors):
+    """Имя ленты подписок с версией из поколений её подписок и авторов.
+
+    Новый пост сдвигает одно поколение автора, а не по ключу
+    на каждого подписчика; списки id и счётчик ленты под прежним
+    именем просто перестают читаться.
+    """
+    generations = get_generations(
+        [feed_members(follow_feed(user_id))]
+        + [author_posts(author_id) for author_id in authors])
+    version = hashlib.md5(
+        '.'.join(map(str, generations)).encode()).hexdigest()
+    return f'{follow_feed(user_id)}:{version}'
+
+
+def change_feed_ids(feeds, change=None):
+    """Сдвинуть поколения состава лент.
+
+    Если передан ``change``, новый список id выводится из прежнего,
+    а не перечитывается из базы.
+    """
+    for feed in feeds:
+        key = GENERATION_KEY.format(feed_members(feed))
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+            continue
+        ids = None if change is None else cache.get(
+            FEED_IDS_KEY.format(feed, version - 1))
+        if ids is None:
+            continue
+        changed = change(ids)[:settings.FEED_CACHED_IDS]
+        # Обрезанный список, став короче предела, выглядел бы полным.
+        if len(changed) < settings.FEED_CACHED_IDS <= len(ids):
+            continue
+        cache.add(FEED_IDS_KEY.format(feed, version), changed,
+                  settings.FEED_IDS_TIMEOUT)
+
+
+def prepend_post(post_id):
+    # Дата поста ставится при создании, так что новый пост — первый.
+    return lambda ids: [post_id, *(pk for pk in ids if pk != post_id)]
+
+
+def remove_post(post_id):
+    return lambda ids: [pk for pk in ids if pk != post_id]
+
+
+def cached_post_ids(feed, posts):
+    """Первые FEED_CACHED_IDS id ленты; при промахе читаются из ``posts``."""
+    version, = get_generations([feed_members(feed)])
+    key = FEED_IDS_KEY.format(feed, version)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(posts.values_list('pk', flat=True)
+                   [:settings.FEED_CACHED_IDS])
+        cache.set(key, ids, settings.FEED_IDS_TIMEOUT)
+    return ids
+
+
+def hydrate_posts(ids):
+    """Записи постов по id одним ``get_many``; промахи читаются из базы."""
+    found = cache.get_many([POST_OBJECT_KEY.format(pk) for pk in ids])
+    posts = {post.pk: post for post in found.values()}
+    missing = [pk for pk in ids if pk not in posts]
+    if missing:
+        fetched = post_records(Post.objects.filter(pk__in=missing)
+                               .order_by())
+        cache.set_many({POST_OBJECT_KEY.format(post.pk): post
+                        for post in fetched}, settings.POST_OBJECT_TIMEOUT)
+        posts.update((post.pk, post) for post in fetched)
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def forget_posts(post_ids):
+    cache.delete_many([POST_OBJECT_KEY.format(pk) for pk in post_ids])
+
+
+def trim_feed(user_id):
+    """Оставить в ленте пользователя не больше FEED_MAX_ENTRIES записей."""
+    boundary = (
+        FeedEntry.objects.filter(user_id=user_id)
+        .values_list('pub_date', 'post_id')
+        [settings.FEED_MAX_ENTRIES:settings.FEED_MAX_ENTRIES + 1]
+    )
+    if not boundary:
+        return
+    pub_date, post_id = boundary[0]
+    FeedEntry.objects.filter(
+        Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, post_id__lte=post_id),
+        user_id=user_id,
+    ).delete()
+
+
+def trim_overgrown_feeds(users):
+    """Обрезать ленты из ``users``, переросшие предел на FEED_TRIM_SLACK.
+
+    Такие ленты находит один запрос; остальные не трогаются.
+    """
+    limit = settings.FEED_MAX_ENTRIES + settings.FEED_TRIM_SLACK
+    overgrown = (
+        FeedEntry.objects.filter(user_id__in=users).order_by()
+        .values('user_id').annotate(entries=Count('pk'))
+        .filter(entries__gt=limit).values_list('user_id', flat=True)
+    )
+    for user_id in overgrown:
+        trim_feed(user_id)
+
+
+def is_pulled(author_id):
+    return PulledAuthor.objects.filter(pk=author_id).exists()
+
+
+def push_post(post):
+    """Разложить новый пост по лентам подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        ignore_conflicts=True,
+    )
+    trim_overgrown_feeds(followers)
+
+
+def backfill_feed(user_id, author_id):
+    """Добавить в ленту пользователя свежие посты автора."""
+    if is_pulled(author_id):
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('pk', 'pub_date')[:settings.FEED_MAX_ENTRIES])
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts],
+        ignore_conflicts=True,
+    )
+    trim_feed(user_id)
+
+
+def retract_feed(user_id, author_id):
+    """Убрать из ленты пользователя посты автора."""
+    FeedEntry.objects.filter(user_id=user_id,
+                             post__author_id=author_id).delete()
+
+
+def backfill_followers(author_id):
+    """Разложить свежие посты автора по лентам всех подписчиков."""
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    for user_id in followers:
+        backfill_feed(user_id, author_id)
+
+
+def update_author_mode(author_id):
+    """Перевести автора между раскладкой при записи и подмешиванием.
+
+    Возвращает True, если режим автора изменился. Посты вернувшегося
+    к раскладке автора раскладывает по лентам ``backfill_followers``.
+    """
+    followers = Follow.objects.filter(author_id=author_id)
+    count = followers.count()
+    pulled = is_pulled(author_id)
+    if not pulled and count >= settings.FEED_PULL_THRESHOLD:
+        PulledAuthor.objects.create(author_id=author_id)
+        FeedEntry.objects.filter(post__author_id=author_id).delete()
+        return True
+    if pulled and count < settings.FEED_PULL_THRESHOLD * PUSH_BACK_RATIO:
+        PulledAuthor.objects.filter(pk=author_id).delete()
+        return True
+    return False
+
+
+class MergedFeed:
+    """Ленивое k-путевое слияние нескольких упорядоченных выборок постов.
+
+    Поддерживает то, что нужно CursorPaginator: ``count()``, срезы
+    от начала, ``filter()`` и ``order_by()``; срез [:b] берёт из каждого
+    источника не больше b строк. Срез с середины прочитал бы все строки
+    до неё, поэтому такие ленты листаются только по курсору.
+    """
+    ordered = True
+
+    def __init__(self, sources, ordering=('-pub_date', '-pk')):
+        self.sources = sources
+        self.ordering = ordering
+
+    def filter(self, *args, **kwargs):
+        return MergedFeed([source.filter(*args, **kwargs)
+                           for source in self.sources], self.ordering)
+
+    def order_by(self, *ordering):
+        return MergedFeed([source.order_by(*ordering)
+                           for source in self.sources], ordering)
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __getitem__(self, index):
+        if (not isinstance(index, slice) or index.stop is None
+                or index.start):
+            raise TypeError('MergedFeed supports only slices from the start.')
+        key = attrgetter(*(field.lstrip('-') for field in self.ordering))
+        merged = heapq.merge(
+            *(source.order_by(*self.ordering)[:index.stop]
+              for source in self.sources),
+            key=key,
+            reverse=self.ordering[0].startswith('-'),
+        )
+        return list(islice(merged, index.stop))
+
+
+def follow_posts(user):
+    """Посты ленты подписок вместе с постами популярных авторов.
+
+    Вторым значением возвращаются id всех авторов из подписок:
+    из их поколений складывается версия ленты.
+    """
+    pushed = with_feed_fields(Post.objects.filter(feed_entries__user=user))
+    follows = Follow.objects.filter(user=user).order_by(
+        'author_id').values_list('author_id', 'author__pulled')
+    authors = []
+    pulled_authors = []
+    for author_id, pulled in follows:
+        authors.append(author_id)
+        if pulled is not None:
+            pulled_authors.append(author_id)
+    if not pulled_authors:
+        return pushed.order_by('-feed_entries__pub_date',
+                               '-feed_entries__post__id'), authors
+    pulled = with_feed_fields(
+        Post.objects.filter(author_id__in=pulled_authors))
+    return MergedFeed([pushed, pulled]), authors
+
+
+class CachedFeed:
+    """Лента для пагинаторов из списка id и записей постов в кэше.
+
+    Порядок ленты и сами посты хранятся раздельно: правка поста
+    меняет одну запись кэша, а не все страницы, где он показан.
+    Страницы дальше FEED_CACHED_IDS постов и курсорные выборки
+    (``filter()`` и ``order_by()``) читаются из ``posts``.
+    """
+    ordered = True
+
+    def __init__(self, feed, posts):
+        self.feed = feed
+        self.posts = posts
+
+    @cached_property
+    def ids(self):
+        return cached_post_ids(self.feed, self.posts)
+
+    @property
+    def complete(self):
+        return len(self.ids) < settings.FEED_CACHED_IDS
+
+    def filter(self, *args, **kwargs):
+        return self.posts.filter(*args, **kwargs)
+
+    def order_by(self, *ordering):
+        return self.posts.order_by(*ordering)
+
+    def count(self):
+        return len(self.ids) if self.complete else self.posts.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.stop is None:
+            raise TypeError('CachedFeed supports only bounded slices.')
+        if not self.complete and index.stop > len(self.ids):
+            return post_records(self.posts[index])
+        return hydrate_posts(self.ids[index])
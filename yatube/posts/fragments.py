@@ -0,0 +1,27 @@
+from core.holes import fragment
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@fragment('switcher', 'includes/switcher.html')
+def switcher(request, index='', follow=''):
+    return {'index': bool(index), 'follow': bool(follow)}
+
+
+@fragment('edit_link', 'includes/post_edit_link.html')
+def edit_link(request, post, author):
+    return {'post_id': post, 'can_edit': str(request.user.pk) == author}
+
+
+@fragment('comment_form', 'includes/comment_form.html')
+def comment_form(request, post):
+    return {'post_id': post, 'form': CommentForm()}
+
+
+@fragment('follow_button', 'includes/follow_button.html')
+def follow_button(request, author, username):
+    following = (request.user.is_authenticated
+                 and Follow.objects.filter(user=request.user,
+                                           author_id=author).exists())
+    return {'username': username, 'following': following}
@@ -0,0 +1,151 @@
+import json
+import platform
+import random
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.benchmarks import measure_requests, seed_data
+from posts.models import Group, User
+
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+# Отдельный кэш, чтобы замер не портил счётчики и поколения рабочего кэша.
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер страниц постов на сгенерированных данных: '
+            'перцентили времени ответа, SQL-запросы и размер ответа. '
+            'Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=3000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок у каждого пользователя.')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Замеряемых запросов на сценарий.')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Незамеряемых запросов перед сценарием.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда записать JSON с итогами.')
+        parser.add_argument('--baseline',
+                            help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост времени и размера ответа.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=BENCH_CACHES,
+                                   SERVER_TIMING_SAMPLE_RATE=0):
+                with transaction.atomic():
+                    results = self.run(options)
+                    transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'options': {name: options[name] for name in (
+                'users', 'groups', 'posts', 'comments', 'follows',
+                'requests', 'warmup', 'seed')},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(options['baseline'], results, options['tolerance'])
+
+    def scenarios(self, options, user_ids, group_ids, post_ids):
+        rng = random.Random(options['seed'])
+        usernames = dict(User.objects.filter(pk__in=user_ids)
+                         .values_list('pk', 'username'))
+        slugs = list(Group.objects.filter(pk__in=group_ids)
+                     .values_list('slug', flat=True))
+        return {
+            'index': lambda: ('get', reverse('posts:index'),
+                              {'page': rng.randint(1, 3)}),
+            'group_list': lambda: ('get', reverse(
+                'posts:group_list', args=[rng.choice(slugs)]), {}),
+            'profile': lambda: ('get', reverse(
+                'posts:profile', args=[usernames[rng.choice(user_ids)]]),
+                {}),
+            'post_detail': lambda: ('get', reverse(
+                'posts:post', args=[rng.choice(post_ids)]), {}),
+            'follow_index': lambda: ('get', reverse('posts:follow_index'),
+                                     {}),
+            'post_create': lambda: ('post', reverse('posts:post_create'), {
+                'text': 'Новый пост', 'group': rng.choice(group_ids)}),
+            'add_comment': lambda: ('post', reverse(
+                'posts:add_comment', args=[rng.choice(post_ids)]),
+                {'text': 'Новый комментарий'}),
+        }
+
+    def run(self, options):
+        user_ids, group_ids, post_ids = seed_data(
+            options['users'], options['groups'], options['posts'],
+            options['comments'], options['follows'], options['seed'])
+        client = Client()
+        client.force_login(User.objects.get(pk=user_ids[0]))
+        results = {}
+        self.stdout.write(
+            f'{"сценарий":<14} {"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8} '
+            f'{"SQL":>6} {"байт":>8}'
+        )
+        scenarios = self.scenarios(options, user_ids, group_ids, post_ids)
+        for name, make_request in scenarios.items():
+            measure_requests(
+                client, [make_request() for _ in range(options['warmup'])])
+            stats = measure_requests(
+                client, [make_request() for _ in range(options['requests'])])
+            results[name] = stats
+            self.stdout.write(
+                f'{name:<14} {stats["p50_ms"]:>8.2f} {stats["p95_ms"]:>8.2f} '
+                f'{stats["p99_ms"]:>8.2f} {stats["queries"]:>6.1f} '
+                f'{stats["bytes"]:>8}'
+            )
+        return results
+
+    def compare(self, path, results, tolerance):
+        """Сравнить итоги с прошлым прогоном и сообщить о регрессиях.
+
+        Время ответа и размер ответа сравниваются с допуском, число
+        SQL-запросов — строго.
+        """
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = []
+        for name, stats in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            for metric, value in stats.items():
+                if metric == 'requests' or metric not in before:
+                    continue
+                old = before[metric]
+                limit = old if metric == 'queries' else old * (1 + tolerance)
+                change = (value - old) / old * 100 if old else 0.0
+                mark = ''
+                if value > limit:
+                    mark = ' !'
+                    regressions.append(f'{name}.{metric}')
+                self.stdout.write(f'{name:<14} {metric:<8} {old:>10} -> '
+                                  f'{value:>10} ({change:+.1f}%){mark}')
+        if regressions:
+            raise CommandError('Регрессии: ' + ', '.join(regressions))
@@ -0,0 +1,95 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import (CaptureQueriesContext,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from posts.benchmarks import percentile
+from posts.feeds import is_pulled, update_author_mode
+from posts.models import FeedEntry, Follow, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает раскладку при записи и подмешивание при чтении '
+            'для авторов с малым и большим числом подписчиков. '
+            'Все данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=10,
+                            help='Подписчиков у обычного автора.')
+        parser.add_argument('--big', type=int, default=5000,
+                            help='Подписчиков у популярного автора.')
+        parser.add_argument('--threshold', type=int, default=1000,
+                            help='Порог FEED_PULL_THRESHOLD на время замера.')
+        parser.add_argument('--posts', type=int, default=20,
+                            help='Постов каждого автора.')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов к /follow/ для замера чтения.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with override_settings(FEED_PULL_THRESHOLD=options['threshold']):
+                with transaction.atomic():
+                    self.run(options)
+                    transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+
+    def seed_author(self, name, followers):
+        author = User.objects.create(username=f'bench_{name}')
+        User.objects.bulk_create(
+            User(username=f'bench_{name}_{i}') for i in range(followers))
+        readers = User.objects.filter(username__startswith=f'bench_{name}_')
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for reader in readers)
+        update_author_mode(author.pk)
+        return author, readers.first()
+
+    def measure_writes(self, author, posts):
+        entries_before = FeedEntry.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for i in range(posts):
+                Post.objects.create(author=author, text=f'Бенчмарк {i}')
+            elapsed = time.perf_counter() - start
+        entries = FeedEntry.objects.count() - entries_before
+        return (entries / posts, len(queries) / posts,
+                elapsed / posts * 1000)
+
+    def measure_reads(self, reader, requests):
+        client = Client()
+        client.force_login(reader)
+        url = reverse('posts:follow_index')
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return percentile(timings, 50), percentile(timings, 95)
+
+    def run(self, options):
+        authors = (
+            ('small', options['small']),
+            ('big', options['big']),
+        )
+        self.stdout.write(
+            f'{"автор":>6} {"подписчиков":>11} {"режим":>6} '
+            f'{"строк/пост":>10} {"SQL/пост":>8} {"мс/пост":>8} '
+            f'{"p50 мс":>7} {"p95 мс":>7}'
+        )
+        for name, followers in authors:
+            author, reader = self.seed_author(name, followers)
+            mode = 'pull' if is_pulled(author.pk) else 'push'
+            rows, queries, write_ms = self.measure_writes(author,
+                                                          options['posts'])
+            p50, p95 = self.measure_reads(reader, options['requests'])
+            self.stdout.write(
+                f'{name:>6} {followers:>11} {mode:>6} {rows:>10.1f} '
+                f'{queries:>8.1f} {write_ms:>8.2f} {p50:>7.2f} {p95:>7.2f}'
+            )
@@ -0,0 +1,59 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from posts.benchmarks import measure_page_build, seed_data
+from posts.feeds import with_feed_fields
+from posts.models import Post
+from posts.paginators import CachedCountPaginator
+from posts.records import post_records
+
+PAGE_SIZES = (10, 50, 100)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает сборку страницы ленты из экземпляров моделей '
+            'и из записей PostRecord: время выборки и отрисовки, память '
+            'и размер в кэше. Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Замеров на размер страницы и способ.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            seed_data(users=20, groups=5, posts=max(PAGE_SIZES),
+                      comments=0, follows=0)
+            self.run(options['repeat'])
+            transaction.set_rollback(True)
+
+    def render(self, posts):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        page = CachedCountPaginator(posts, len(posts)).page(1)
+        return render_to_string('posts/index.html',
+                                {'page_obj': page, 'index': True},
+                                request=request)
+
+    def run(self, repeat):
+        ways = (
+            ('orm', lambda size: list(
+                with_feed_fields(Post.objects.all())[:size])),
+            ('records', lambda size: post_records(Post.objects.all()[:size])),
+        )
+        self.stdout.write(
+            f'{"постов":>6} {"способ":>7} {"выборка мс":>10} '
+            f'{"шаблон мс":>9} {"память КиБ":>10} {"пик КиБ":>8} '
+            f'{"pickle КиБ":>10}')
+        for size in PAGE_SIZES:
+            for name, fetch in ways:
+                stats = measure_page_build(lambda: fetch(size), self.render,
+                                           repeat)
+                self.stdout.write(
+                    f'{size:>6} {name:>7} {stats["fetch_ms"]:>10.2f} '
+                    f'{stats["render_ms"]:>9.2f} '
+                    f'{stats["retained_kib"]:>10.1f} '
+                    f'{stats["peak_kib"]:>8.1f} '
+                    f'{stats["pickled_kib"]:>10.1f}')
@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.iterators import batched
+from posts.media import delete_thumbnails, image_storage, walk_storage
+from posts.models import Post, StoredImage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки, миниатюры и записи sorl-thumbnail, '
+            'на которые не ссылается ни один пост.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help=('Не трогать оригиналы моложе стольких секунд: пост '
+                  'с ними может быть ещё не закоммичен.'))
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.uploaded_before = (timezone.now()
+                                - timedelta(seconds=options['min_age']))
+        self.report = {'originals': 0, 'thumbnails': 0, 'kv_rows': 0,
+                       'bytes': 0}
+        self.collect_originals()
+        self.collect_kv_rows()
+        self.collect_thumbnail_files()
+        prefix = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}: оригиналов {self.report["originals"]}, '
+            f'миниатюр {self.report["thumbnails"]}, '
+            f'записей sorl {self.report["kv_rows"]}, '
+            f'байт {self.report["bytes"]}'
+        ))
+
+    def referenced(self, names):
+        return set(Post.objects.filter(image__in=names)
+                   .values_list('image', flat=True))
+
+    def stored(self, names):
+        return set(StoredImage.objects.filter(name__in=names)
+                   .values_list('name', flat=True))
+
+    def settled(self, storage, name):
+        """Загрузка закончена и её пост, если он есть, уже закоммичен."""
+        # Недописанные загрузки ещё переименовываются.
+        return (not name.endswith('.tmp')
+                and storage.get_modified_time(name) < self.uploaded_before)
+
+    def remove_file(self, storage, name, kind):
+        self.report[kind] += 1
+        self.report['bytes'] += storage.size(name)
+        if self.dry_run:
+            self.stdout.write(f'{kind}: {name}')
+        else:
+            storage.delete(name)
+
+    def remove_thumbnails(self, name):
+        if self.dry_run:
+            thumbnails = default.kvstore._get(ImageFile(name).key,
+                                              identity='thumbnails')
+            self.report['thumbnails'] += len(thumbnails or ())
+        else:
+            self.report['thumbnails'] += delete_thumbnails(name)
+
+    def collect_originals(self):
+        """Давние оригиналы картинок без постов и учёта ссылок."""
+        storage = image_storage()
+        upload_to = Post._meta.get_field('image').upload_to
+        if not storage.exists(upload_to):
+            return
+        for names in batched(walk_storage(storage, upload_to.rstrip('/')),
+                             self.batch_size):
+            names = [name for name in names if self.settled(storage, name)]
+            for name in (set(names) - self.referenced(names)
+                         - self.stored(names)):
+                self.remove_thumbnails(name)
+                self.remove_file(storage, name, 'originals')
+
+    def kv_batches(self):
+        """Записи sorl о файлах пачками по ключу, без открытого курсора."""
+        rows = (KVStoreModel.objects
+                .filter(key__startswith=add_prefix('', 'image'))
+                .order_by('key').values_list('key', 'value'))
+        batch = list(rows[:self.batch_size])
+        while batch:
+            yield batch
+            batch = list(rows.filter(key__gt=batch[-1][0])
+                         [:self.batch_size])
+
+    def collect_kv_rows(self):
+        """Записи sorl об исчезнувших оригиналах и миниатюрах."""
+        for batch in self.kv_batches():
+            images = {key: deserialize_image_file(value)
+                      for key, value in batch}
+            sources = [image.name for image in images.values()
+                       if not image.name.startswith(
+                           sorl_settings.THUMBNAIL_PREFIX)]
+            referenced = self.referenced(sources)
+            for key, image in images.items():
+                # Существующие оригиналы без ссылок уже разобраны выше.
+                if image.name in referenced or image.exists():
+                    continue
+                self.report['kv_rows'] += 1
+                if image.name in sources:
+                    self.remove_thumbnails(image.name)
+                elif not self.dry_run:
+                    default.kvstore._delete_raw(key)
+
+    def collect_thumbnail_files(self):
+        """Файлы миниатюр, о которых sorl ничего не знает."""
+        storage = default.storage
+        prefix = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        if not storage.exists(prefix):
+            return
+        for names in batched(walk_storage(storage, prefix),
+                             self.batch_size):
+            keys = {add_prefix(ImageFile(name, storage).key): name
+                    for name in names}
+            known = set(KVStoreModel.objects.filter(key__in=list(keys))
+                        .values_list('key', flat=True))
+            for key, name in keys.items():
+                if key not in known:
+                    self.remove_file(storage, name, 'thumbnails')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import backfill_feed, change_feed_ids, follow_feed
+from posts.models import FeedEntry, Follow
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок с нуля.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            deleted, _ = FeedEntry.objects.all().delete()
+            follows = Follow.objects.values_list('user_id', 'author_id')
+            users = set()
+            for user_id, author_id in follows.iterator():
+                backfill_feed(user_id, author_id)
+                users.add(user_id)
+        change_feed_ids(map(follow_feed, users))
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей: {deleted}, '
+            f'создано: {FeedEntry.objects.count()}'
+        ))
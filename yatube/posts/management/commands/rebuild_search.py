@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов с нуля.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            terms, entries = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Слов в индексе: {terms}, записей: {entries}'
+        ))
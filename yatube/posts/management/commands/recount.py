@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import recount
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, комментариев и подписок '
+            'и исправляет разошедшиеся значения.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = recount()
+        self.stdout.write(self.style.SUCCESS(
+            'Исправлено строк: ' + ', '.join(
+                f'{model} — {count}' for model, count in fixed.items())
+        ))
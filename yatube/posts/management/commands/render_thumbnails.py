@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import render_in_worker, render_post_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры картинок всех постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Потоков генерации; 0 — без потоков.')
+
+    def handle(self, *args, **options):
+        posts = (Post.objects.exclude(image='').order_by()
+                 .values_list('pk', flat=True))
+        if not options['workers']:
+            rendered = sum(map(render_post_thumbnails, posts.iterator()))
+        else:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                rendered = sum(executor.map(render_in_worker,
+                                            posts.iterator()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано миниатюр: {rendered}'))
@@ -0,0 +1,92 @@
+import logging
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post, StoredImage
+from .thumbnails import forget_thumbnails
+
+logger = logging.getLogger(__name__)
+
+
+def image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def acquire_image(name, content=None):
+    """Учесть ещё один пост, ссылающийся на файл ``name``.
+
+    Хранилище могло переиспользовать файл, который тут же удалило
+    снятие последней ссылки; тогда он записывается заново из ``content``.
+    """
+    if not StoredImage.objects.filter(name=name).update(
+            refs=F('refs') + 1):
+        try:
+            with transaction.atomic():
+                StoredImage.objects.create(name=name, refs=1)
+        except IntegrityError:
+            # Запись успел создать параллельный запрос.
+            StoredImage.objects.filter(name=name).update(refs=F('refs') + 1)
+    # Ссылка уже учтена, и удаление файла после этой проверки ждёт
+    # блокировки строки до коммита, а затем видит refs > 0.
+    storage = image_storage()
+    if content is not None and not storage.exists(name):
+        storage.write(name, content)
+
+
+def release_image(name):
+    """Снять ссылку поста на файл; последняя ссылка удаляет файл.
+
+    Файлы удаляются после коммита, чтобы откат транзакции
+    не оставил пост без картинки.
+    """
+    StoredImage.objects.filter(name=name).update(refs=F('refs') - 1)
+    transaction.on_commit(lambda: delete_if_unreferenced(name))
+
+
+def delete_if_unreferenced(name):
+    # Файл удаляется под блокировкой строки, чтобы acquire_image
+    # не учёл ссылку между удалением записи и файла.
+    with transaction.atomic():
+        unreferenced = StoredImage.objects.select_for_update().filter(
+            name=name, refs__lte=0)
+        if unreferenced.exists():
+            unreferenced.delete()
+            delete_image(name)
+
+
+def delete_thumbnails(name):
+    """Удалить миниатюры картинки и их записи в хранилище ключей sorl.
+
+    Возвращает число удалённых миниатюр.
+    """
+    source = ImageFile(name)
+    thumbnails = default.kvstore._get(source.key, identity='thumbnails')
+    default.kvstore.delete(source)
+    forget_thumbnails(name)
+    return len(thumbnails or ())
+
+
+def delete_image(name):
+    """Удалить оригинал картинки вместе с миниатюрами."""
+    try:
+        delete_thumbnails(name)
+        image_storage().delete(name)
+    except (OSError, SuspiciousFileOperation):
+        logger.exception('Не удалось удалить картинку %s', name)
+
+
+def walk_storage(storage, path):
+    """Имена всех файлов каталога хранилища, включая вложенные.
+
+    В памяти держится только содержимое одного каталога.
+    """
+    directories, files = storage.listdir(path)
+    for file_name in files:
+        yield posixpath.join(path, file_name)
+    for directory in directories:
+        yield from walk_storage(storage, posixpath.join(path, directory))
@@ -0,0 +1,80 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:16
+
+from collections import Counter
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+WORD_RE = re.compile(r'\w+')
+
+
+def terms_of(post):
+    author = post.author
+    parts = [post.text, author.username, author.first_name, author.last_name]
+    if post.group_id is not None:
+        parts.append(post.group.title)
+    return {
+        word[:64] for part in parts
+        for word in WORD_RE.findall(part.lower().replace('ё', 'е'))
+        if len(word) > 1
+    }
+
+
+def fill_search_index(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    SearchEntry = apps.get_model('posts', 'SearchEntry')
+    SearchTerm = apps.get_model('posts', 'SearchTerm')
+    counts = Counter()
+    entries = []
+    for post in Post.objects.select_related('author', 'group').iterator():
+        terms = terms_of(post)
+        counts.update(terms)
+        entries.extend(
+            SearchEntry(term=term, post_id=post.pk, pub_date=post.pub_date)
+            for term in terms)
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(term=term, posts_count=count)
+         for term, count in counts.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_stored_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('term', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Слово')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Число постов')),
+            ],
+            options={
+                'verbose_name': 'Слово поискового индекса',
+                'verbose_name_plural': 'Слова поискового индекса',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Слово')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='posts.Post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['term', '-pub_date', '-post'], name='search_entry_term_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_search_entry'),
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,56 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import DatabaseError, models, transaction
 from django.db.models.constraints import UniqueConstraint
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountedModel(models.Model):
+    """Модель со счётчиками, которые сдвигает только change_counters.
+
+    Сохранение загруженного раньше экземпляра не записывает их: иначе
+    устаревшее значение затёрло бы сдвиги, сделанные после загрузки.
+    """
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+            try:
+                # Точка сохранения: ошибку ниже Django помечает
+                # как сорвавшую всю внешнюю транзакцию.
+                with transaction.atomic():
+                    super().save(**{**kwargs, 'update_fields': update_fields})
+                return
+            except DatabaseError as error:
+                # Так Django сообщает, что строки уже нет; обычное
+                # сохранение тогда вставит её заново.
+                if type(error) is not DatabaseError:
+                    raise
+        super().save(*args, **kwargs)
+
+
+class Group(CountedModel):
     title = models.CharField(verbose_name='Название',
                              max_length=200,
                              help_text='Введите название группы')
     slug = models.SlugField('Слаг', unique=True)
     description = models.TextField('Описание',
                                    help_text='Введите описание группы')
+    posts_count = models.IntegerField('Число постов', default=0,
+                                      editable=False)
+    counter_fields = ('posts_count',)
 
     class Meta:
         verbose_name_plural = 'Группы постов'
@@ -21,7 +60,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(CountedModel):
     text = models.TextField('Текст поста', help_text='Введите текст поста')
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
     author = models.ForeignKey(
@@ -41,13 +80,26 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.IntegerField('Число комментариев',
+                                         default=0, editable=False)
+    counter_fields = ('comments_count',)
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name_plural = 'Посты'
         verbose_name = 'Пост'
+        # id в хвосте индексов совпадает с порядком keyset-пагинации.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -73,6 +125,13 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+            # Порядок списка комментариев в админке.
+            models.Index(fields=['-created', '-id'],
+                         name='comment_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -91,3 +150,97 @@ class Follow(models.Model):
         constraints = [
             UniqueConstraint(fields=['user', 'author'], name='unique_follow')
         ]
+        # Уникальность покрывает поиск по user, этот индекс — по author.
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx')
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, поддерживаемые сигналами через F()."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    posts_count = models.IntegerField('Число постов', default=0)
+    followers_count = models.IntegerField('Число подписчиков', default=0)
+    following_count = models.IntegerField('Число подписок', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+        verbose_name = 'Счётчики пользователя'
+
+
+class StoredImage(models.Model):
+    """Файл картинки в хранилище и число постов, которые на него ссылаются."""
+    name = models.CharField('Имя файла', max_length=100, primary_key=True)
+    refs = models.IntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Файлы картинок'
+        verbose_name = 'Файл картинки'
+
+
+class PulledAuthor(models.Model):
+    """Популярный автор, чьи посты подмешиваются в ленты при чтении."""
+    author = models.OneToOneField(User,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='pulled')
+
+    class Meta:
+        verbose_name_plural = 'Популярные авторы'
+        verbose_name = 'Популярный автор'
+
+
+class SearchTerm(models.Model):
+    """Слово поискового индекса и число постов, в которых оно встречается."""
+    term = models.CharField('Слово', max_length=64, primary_key=True)
+    posts_count = models.IntegerField('Число постов', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Слова поискового индекса'
+        verbose_name = 'Слово поискового индекса'
+
+
+class SearchEntry(models.Model):
+    """Вхождение слова в пост: запись инвертированного индекса."""
+    term = models.CharField('Слово', max_length=64)
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='search_entries')
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['term', 'post'],
+                             name='unique_search_entry')
+        ]
+        # Выдача по слову читается из индекса уже в порядке ленты.
+        indexes = [
+            models.Index(fields=['term', '-pub_date', '-post'],
+                         name='search_entry_term_date_idx')
+        ]
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries')
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ('-pub_date', '-post_id')
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'],
+                             name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_entry_user_date_idx')
+        ]
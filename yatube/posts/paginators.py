@@ -0,0 +1,234 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import AutoField, Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+CURSOR_SEPARATOR = '|'
+FEED_COUNT_KEY = 'feed_count:{}'
+
+
+def adjust_feed_counts(feeds, delta):
+    """Сдвинуть закэшированные счётчики лент; отсутствующие не трогаем."""
+    for feed in feeds:
+        try:
+            cache.incr(FEED_COUNT_KEY.format(feed), delta)
+        except ValueError:
+            pass
+
+
+def cached_feed_count(feed, posts):
+    """Число постов ленты из кэша; при промахе считается по ``posts``."""
+    key = FEED_COUNT_KEY.format(feed)
+    count = cache.get(key)
+    if count is None:
+        count = posts.count()
+        cache.set(key, count, settings.FEED_COUNT_TIMEOUT)
+    return count
+
+
+def encode_cursor(pub_date, pk):
+    raw = f'{pub_date.isoformat()}{CURSOR_SEPARATOR}{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Вернуть пару (pub_date, pk) из токена или None, если он испорчен."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split(CURSOR_SEPARATOR)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} objects>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.cursor_for(self.object_list[0])
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по паре (дата публикации, id).
+
+    Каждая страница выбирается одним запросом с условием на ключ
+    последнего показанного поста, поэтому её стоимость не зависит
+    от глубины прокрутки, а новые посты не сдвигают уже открытые страницы.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 id_field='pk'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.id_field = id_field
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, self.date_field),
+                             getattr(obj, self.id_field))
+
+    def _older_than(self, pub_date, pk):
+        return (Q(**{f'{self.date_field}__lt': pub_date})
+                | Q(**{self.date_field: pub_date,
+                       f'{self.id_field}__lt': pk}))
+
+    def _newer_than(self, pub_date, pk):
+        return (Q(**{f'{self.date_field}__gt': pub_date})
+                | Q(**{self.date_field: pub_date,
+                       f'{self.id_field}__gt': pk}))
+
+    def _fetch(self, condition, descending):
+        prefix = '-' if descending else ''
+        queryset = self.object_list.order_by(f'{prefix}{self.date_field}',
+                                             f'{prefix}{self.id_field}')
+        if condition is not None:
+            queryset = queryset.filter(condition)
+        rows = list(queryset[:self.per_page + 1])
+        return rows[:self.per_page], len(rows) > self.per_page
+
+    def get_cursor_page(self, after=None, before=None):
+        """Вернуть страницу после (или до) позиции из токена.
+
+        Испорченный токен, как и номер страницы в ``get_page``,
+        не приводит к ошибке: показывается первая страница.
+        """
+        position = decode_cursor(before)
+        if position is not None:
+            rows, has_previous = self._fetch(self._newer_than(*position),
+                                             descending=False)
+            if has_previous:
+                return CursorPage(rows[::-1], self, True, True)
+            # Дошли до начала ленты: отдаём полную первую страницу.
+        position = None if before else decode_cursor(after)
+        if position is None:
+            rows, has_next = self._fetch(None, descending=True)
+            return CursorPage(rows, self, has_next, False)
+        rows, has_next = self._fetch(self._older_than(*position),
+                                     descending=True)
+        return CursorPage(rows, self, has_next, True)
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор с кэшированным числом постов ленты и окном номеров страниц.
+
+    Счётчик хранится в кэше под именем ленты и поправляется сигналами
+    при создании и удалении постов, так что ``COUNT(*)`` выполняется
+    только при холодном кэше.
+    """
+    ELLIPSIS = '…'
+    on_each_side = 2
+    on_ends = 1
+
+    def __init__(self, object_list, per_page, feed=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.feed = feed
+
+    @cached_property
+    def count(self):
+        if self.feed is None:
+            return Paginator.count.func(self)
+        return cached_feed_count(self.feed, self.object_list)
+
+    def get_elided_page_range(self, number=1):
+        """Номера страниц: края ленты и окрестность текущей, с пропусками."""
+        number = self.validate_number(number)
+        num_pages = self.num_pages
+        if num_pages <= (self.on_each_side + self.on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + self.on_each_side + self.on_ends + 1:
+            yield from range(1, self.on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - self.on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < num_pages - self.on_each_side - self.on_ends - 1:
+            yield from range(number + 1, number + self.on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(num_pages - self.on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+    def page(self, number):
+        page = super().page(number)
+        page.elided_page_range = list(self.get_elided_page_range(page.number))
+        return page
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы без полного ``COUNT(*)``; None, если
+    оценить нечем.
+
+    PostgreSQL хранит оценку в статистике планировщика. На остальных
+    базах строки считаются до ADMIN_COUNT_LIMIT, а в таблице больше
+    предела берётся наибольший автоинкрементный ключ: это оценка сверху,
+    удалённые строки в ней не вычитаются.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None and row[0] >= 0:
+            return int(row[0])
+        return None
+    if isinstance(model._meta.pk, AutoField):
+        rows = model._default_manager.using(queryset.db).order_by()
+        counted = rows[:settings.ADMIN_COUNT_LIMIT].count()
+        if counted < settings.ADMIN_COUNT_LIMIT:
+            return counted
+        return max(counted, rows.aggregate(last=Max('pk'))['last'] or 0)
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки, не пересчитывающий большие таблицы.
+
+    Без фильтров число строк оценивается, с фильтрами и поиском
+    считается не дальше ADMIN_COUNT_LIMIT строк.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimate = estimated_count(queryset)
+            if estimate is not None:
+                return estimate
+        return queryset.order_by()[:settings.ADMIN_COUNT_LIMIT].count()
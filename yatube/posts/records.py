@@ -0,0 +1,120 @@
+from django.db.models import Model
+
+from .models import Group, Post, User
+
+IMAGE_STORAGE = Post._meta.get_field('image').storage
+# Ровно те поля, которые выводят шаблоны лент.
+RECORD_FIELDS = (
+    'pk', 'text', 'pub_date', 'image',
+    'author_id', 'author__username', 'author__first_name',
+    'author__last_name',
+    'group_id', 'group__slug', 'group__title',
+)
+
+
+class Record:
+    """Запись для чтения: поля в ``__slots__`` вместо экземпляра модели.
+
+    Равна экземпляру модели с тем же pk, как экземпляры моделей
+    равны между собой.
+    """
+    __slots__ = ('pk',)
+    model = None
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.model is other.model and self.pk == other.pk
+        if isinstance(other, Model):
+            return (self.model is other._meta.concrete_model
+                    and self.pk == other.pk)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    @property
+    def id(self):
+        return self.pk
+
+
+class AuthorRecord(Record):
+    __slots__ = ('username', 'first_name', 'last_name')
+    model = User
+
+    def __init__(self, pk, username, first_name, last_name):
+        self.pk = pk
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+    def __str__(self):
+        return self.username
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+
+class GroupRecord(Record):
+    __slots__ = ('slug', 'title')
+    model = Group
+
+    def __init__(self, pk, slug, title):
+        self.pk = pk
+        self.slug = slug
+        self.title = title
+
+    def __str__(self):
+        return self.title
+
+
+class ImageRecord:
+    """Путь картинки с ``url``, как у файла из поля модели."""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __bool__(self):
+        return bool(self.name)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def url(self):
+        return IMAGE_STORAGE.url(self.name)
+
+
+class PostRecord(Record):
+    """Пост для лент; ``thumbnails`` заполняет prefetch_thumbnails."""
+    __slots__ = ('text', 'pub_date', 'image', 'author', 'group',
+                 'thumbnails')
+    model = Post
+
+    def __init__(self, pk, text, pub_date, image, author, group):
+        self.pk = pk
+        self.text = text
+        self.pub_date = pub_date
+        self.image = image
+        self.author = author
+        self.group = group
+
+    def __str__(self):
+        return self.text[:15]
+
+    @classmethod
+    def from_row(cls, row):
+        (pk, text, pub_date, image, author_id, username, first_name,
+         last_name, group_id, slug, title) = row
+        group = None
+        if group_id is not None:
+            group = GroupRecord(group_id, slug, title)
+        return cls(pk, text, pub_date, ImageRecord(image),
+                   AuthorRecord(author_id, username, first_name, last_name),
+                   group)
+
+
+def post_records(posts):
+    """Записи постов выборки одним запросом только нужных полей."""
+    return [PostRecord.from_row(row)
+            for row in posts.values_list(*RECORD_FIELDS)]
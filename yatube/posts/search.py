@@ -0,0 +1,122 @@
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef
+
+from core.iterators import batched
+
+from .counters import change_counters
+from .models import Post, SearchEntry, SearchTerm
+
+TERM_MAX_LENGTH = SearchTerm._meta.get_field('term').max_length
+WORD_RE = re.compile(r'\w+')
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+# Столько id или слов подставляется в один IN, чтобы не упереться
+# в лимит параметров SQLite.
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    """Слова текста в нормальной форме: нижний регистр, «ё» как «е»."""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [word[:TERM_MAX_LENGTH] for word in words if len(word) > 1]
+
+
+def post_terms(post):
+    """Слова поста: текст, имя автора и название группы."""
+    author = post.author
+    parts = [post.text, *(getattr(author, field) for field in AUTHOR_FIELDS)]
+    if post.group_id is not None:
+        parts.append(post.group.title)
+    return {term for part in parts for term in tokenize(part)}
+
+
+def index_post(post):
+    """Привести записи индекса поста в соответствие с его словами."""
+    terms = post_terms(post)
+    entries = SearchEntry.objects.filter(post=post)
+    indexed = set(entries.values_list('term', flat=True))
+    for removed in batched(sorted(indexed - terms), BATCH_SIZE):
+        entries.filter(term__in=removed).delete()
+        change_counters(SearchTerm.objects.filter(term__in=removed),
+                        posts_count=-1)
+    for added in batched(sorted(terms - indexed), BATCH_SIZE):
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term) for term in added], ignore_conflicts=True)
+        change_counters(SearchTerm.objects.filter(term__in=added),
+                        posts_count=1)
+        SearchEntry.objects.bulk_create(
+            [SearchEntry(term=term, post=post, pub_date=post.pub_date)
+             for term in added],
+            ignore_conflicts=True,
+        )
+
+
+def unindex_post(post):
+    """Уменьшить частоты слов удаляемого поста; записи удалит каскад."""
+    terms = SearchEntry.objects.filter(post=post).values('term')
+    change_counters(SearchTerm.objects.filter(term__in=terms),
+                    posts_count=-1)
+
+
+def reindex_posts(post_ids):
+    for chunk in batched(post_ids, BATCH_SIZE):
+        posts = Post.objects.filter(pk__in=chunk).select_related('author',
+                                                                 'group')
+        for post in posts:
+            index_post(post)
+
+
+def rebuild_index():
+    """Собрать индекс заново по всем постам.
+
+    Возвращает число слов и записей индекса.
+    """
+    SearchEntry.objects.all().delete()
+    SearchTerm.objects.all().delete()
+    counts = Counter()
+    posts = (Post.objects.select_related('author', 'group')
+             .order_by('pk').iterator(chunk_size=BATCH_SIZE))
+    for chunk in batched(posts, BATCH_SIZE):
+        entries = []
+        for post in chunk:
+            terms = post_terms(post)
+            counts.update(terms)
+            entries.extend(
+                SearchEntry(term=term, post=post, pub_date=post.pub_date)
+                for term in terms)
+        SearchEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+    SearchTerm.objects.bulk_create(
+        (SearchTerm(term=term, posts_count=count)
+         for term, count in counts.items()),
+        batch_size=BATCH_SIZE,
+    )
+    return len(counts), sum(counts.values())
+
+
+def search_posts(query):
+    """Посты со всеми словами запроса, от новых к старым.
+
+    Посты перебираются по записям самого редкого слова: они читаются
+    из индекса (слово, дата, пост) уже в порядке выдачи, а остальные
+    слова проверяются точечно по уникальному индексу (слово, пост).
+    Ключ порядка аннотирован как ``found_date`` и ``found_id``.
+    """
+    terms = set(tokenize(query)[:settings.SEARCH_MAX_TERMS])
+    found = dict(
+        SearchTerm.objects.filter(term__in=terms, posts_count__gt=0)
+        .values_list('term', 'posts_count')
+    )
+    rarest = min(found, key=found.get) if found else ''
+    posts = Post.objects.filter(search_entries__term=rarest)
+    for number, term in enumerate(sorted(terms - {rarest})):
+        has_term = f'has_term_{number}'
+        posts = posts.annotate(**{has_term: Exists(
+            SearchEntry.objects.filter(term=term, post=OuterRef('pk')))
+        }).filter(**{has_term: True})
+    posts = posts.annotate(found_date=F('search_entries__pub_date'),
+                           found_id=F('search_entries__post_id'))
+    if not terms or len(found) < len(terms):
+        return posts.none()
+    return posts
@@ -0,0 +1,341 @@
+import logging
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .counters import change_counters, change_group_posts, change_user_stats
+from .feeds import (GROUPS_GENERATION, author_display_feeds, backfill_feed,
+                    backfill_followers, bump_generations, change_feed_ids,
+                    follow_feed, followers_generation, forget_posts,
+                    group_feed, is_pulled, post_display_feeds, post_feeds,
+                    post_generation, prepend_post, profile_feed, push_post,
+                    remove_post, retract_feed, update_author_mode)
+from .media import acquire_image, release_image
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .paginators import adjust_feed_counts
+from .search import AUTHOR_FIELDS, index_post, reindex_posts, unindex_post
+from .thumbnails import forget_thumbnails, get_executor
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, **kwargs):
+    instance._old_group_id = None
+    instance._old_image = ''
+    if instance.pk is not None:
+        instance._old_group_id, instance._old_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image').first() or (None, '')
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust_feed_counts(post_feeds(instance), 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id != instance.group_id:
+        if old_group_id is not None:
+            adjust_feed_counts([group_feed(old_group_id)], -1)
+        if instance.group_id is not None:
+            adjust_feed_counts([group_feed(instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    adjust_feed_counts(post_feeds(instance), -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        push_post(instance)
+
+
+def invalidate_follow_feeds(author_id):
+    """Сменить версию лент всех подписчиков автора одним ключом."""
+    change_feed_ids([profile_feed(author_id)])
+
+
+def backfill_in_worker(author_id):
+    """``backfill_followers`` для фонового потока."""
+    try:
+        backfill_followers(author_id)
+        invalidate_follow_feeds(author_id)
+    except Exception:
+        logger.exception('Не удалось разложить посты автора %s', author_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_backfill(author_id):
+    """Разложить посты автора по лентам подписчиков после коммита
+    в потоках миниатюр, а не в запросе.
+    """
+    def submit():
+        if settings.THUMBNAIL_WORKERS:
+            get_executor().submit(backfill_in_worker, author_id)
+        else:
+            backfill_followers(author_id)
+            invalidate_follow_feeds(author_id)
+
+    transaction.on_commit(submit)
+
+
+def refresh_author_mode(author_id):
+    if not update_author_mode(author_id):
+        return
+    invalidate_follow_feeds(author_id)
+    if not is_pulled(author_id):
+        schedule_backfill(author_id)
+
+
+@receiver(post_save, sender=Follow)
+def fill_follow_feed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill_feed(instance.user_id, instance.author_id)
+        refresh_author_mode(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_follow_feed(sender, instance, **kwargs):
+    retract_feed(instance.user_id, instance.author_id)
+    refresh_author_mode(instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def bump_post_generations(sender, instance, **kwargs):
+    feeds = post_display_feeds(instance)
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id is not None and old_group_id != instance.group_id:
+        feeds.append(group_feed(old_group_id))
+    bump_generations(feeds)
+
+
+@receiver(post_save, sender=Post)
+def update_saved_post_ids(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_feed_ids(post_feeds(instance), prepend_post(instance.pk))
+        return
+    forget_posts([instance.pk])
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id != instance.group_id:
+        if old_group_id is not None:
+            change_feed_ids([group_feed(old_group_id)],
+                            remove_post(instance.pk))
+        if instance.group_id is not None:
+            change_feed_ids([group_feed(instance.group_id)])
+
+
+@receiver(post_delete, sender=Post)
+def update_deleted_post_ids(sender, instance, **kwargs):
+    forget_posts([instance.pk])
+    change_feed_ids(post_feeds(instance), remove_post(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def update_follow_feed_ids(sender, instance, **kwargs):
+    change_feed_ids([follow_feed(instance.user_id)])
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def bump_comment_generation(sender, instance, **kwargs):
+    bump_generations([post_generation(instance.post_id)])
+
+
+@receiver([post_save, post_delete], sender=Group)
+def bump_group_generations(sender, instance, **kwargs):
+    bump_generations([group_feed(instance.pk), GROUPS_GENERATION])
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def bump_follow_generation(sender, instance, **kwargs):
+    bump_generations([follow_feed(instance.user_id),
+                      followers_generation(instance.author_id)])
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_post_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_user_stats(instance.author_id, posts_count=1)
+        change_group_posts(instance.group_id, 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id != instance.group_id:
+        change_group_posts(old_group_id, -1)
+        change_group_posts(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post_stats(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, posts_count=-1)
+    change_group_posts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counters(Post.objects.filter(pk=instance.post_id),
+                        comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    change_counters(Post.objects.filter(pk=instance.post_id),
+                    comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_user_stats(instance.user_id, following_count=1)
+        change_user_stats(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    change_user_stats(instance.user_id, following_count=-1)
+    change_user_stats(instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def forget_replaced_thumbnails(sender, instance, created, **kwargs):
+    old_image = getattr(instance, '_old_image', '')
+    if old_image and old_image != instance.image.name:
+        forget_thumbnails(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def forget_deleted_thumbnails(sender, instance, **kwargs):
+    if instance.image:
+        forget_thumbnails(instance.image.name)
+
+
+@receiver(pre_save, sender=Post)
+def remember_new_image(sender, instance, **kwargs):
+    image = instance.image
+    instance._new_image = None if image._committed else image.file
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_image = getattr(instance, '_old_image', '')
+    if old_image == instance.image.name:
+        return
+    if instance.image:
+        acquire_image(instance.image.name,
+                      getattr(instance, '_new_image', None))
+    if old_image:
+        release_image(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    unindex_post(instance)
+
+
+@receiver(pre_save, sender=Group)
+def remember_old_title(sender, instance, **kwargs):
+    instance._old_title = None
+    if instance.pk is not None:
+        instance._old_title = Group.objects.filter(
+            pk=instance.pk).values_list('title', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def reindex_renamed_group(sender, instance, created, raw=False, **kwargs):
+    old_title = getattr(instance, '_old_title', None)
+    if not raw and old_title is not None and old_title != instance.title:
+        reindex_posts(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    instance._post_ids = list(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def reindex_ungrouped_posts(sender, instance, **kwargs):
+    reindex_posts(getattr(instance, '_post_ids', []))
+
+
+@receiver(post_save, sender=Group)
+def forget_group_posts(sender, instance, created, raw=False, **kwargs):
+    # Посты в кэше хранят название и slug группы.
+    if not created and not raw:
+        forget_posts(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def forget_ungrouped_posts(sender, instance, **kwargs):
+    forget_posts(getattr(instance, '_post_ids', []))
+
+
+@receiver(pre_save, sender=User)
+def remember_old_names(sender, instance, update_fields=None, **kwargs):
+    instance._old_names = None
+    if instance.pk is None:
+        return
+    # Вход в систему сохраняет только last_login: лишний запрос не нужен.
+    if update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    instance._old_names = User.objects.filter(
+        pk=instance.pk).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def reindex_renamed_author(sender, instance, raw=False, **kwargs):
+    old_names = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if not raw and old_names is not None and old_names != names:
+        reindex_posts(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def forget_renamed_author_posts(sender, instance, raw=False, **kwargs):
+    old_names = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if not raw and old_names is not None and old_names != names:
+        forget_posts(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def bump_renamed_author_feeds(sender, instance, raw=False, **kwargs):
+    # Имя выводится на страницах: без сдвига поколений ETag и кэш
+    # страниц продолжат отдавать старое.
+    old_names = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if not raw and old_names is not None and old_names != names:
+        bump_generations(author_display_feeds(instance))
@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from django import template
+from django.conf import settings
+
+from ..thumbnails import prefetch_thumbnails
+
+register = template.Library()
+
+MIME_TYPES = {
+    'GIF': 'image/gif',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+def srcset(images):
+    return ', '.join(f'{image.url} {image.width}w'
+                     for image in sorted(images, key=lambda im: im.width))
+
+
+@register.simple_tag(takes_context=True)
+def post_picture(context, post):
+    """Готовые варианты картинки поста для ``<picture>`` или None.
+
+    Шаблон никогда не создаёт миниатюры сам: если каких-то нет,
+    генерация ставится в фоновую очередь. Миниатюры ищутся
+    сразу для всей страницы ``page_obj``.
+    """
+    if not hasattr(post, 'thumbnails'):
+        page = context.get('page_obj')
+        if page is not None and post in page.object_list:
+            prefetch_thumbnails(page.object_list)
+        else:
+            prefetch_thumbnails([post])
+    thumbnails = post.thumbnails
+    if not thumbnails or None in thumbnails.values():
+        return None
+    by_format = defaultdict(list)
+    for size, image in thumbnails.items():
+        _, options = settings.POST_THUMBNAILS[size]
+        by_format[options.get('format', 'JPEG')].append(image)
+    _, options = settings.POST_THUMBNAILS[settings.POST_THUMBNAIL_FALLBACK]
+    fallback_format = options.get('format', 'JPEG')
+    return {
+        'src': thumbnails[settings.POST_THUMBNAIL_FALLBACK],
+        'srcset': srcset(by_format.pop(fallback_format)),
+        'sizes': settings.POST_IMAGE_SIZES,
+        'sources': [{'type': MIME_TYPES[image_format],
+                     'srcset': srcset(images)}
+                    for image_format, images in by_format.items()],
+    }
@@ -0,0 +1,92 @@
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Group, Post, User
+from ..paginators import EstimatedCountPaginator
+
+
+class AdminChangeListTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        cls.group = Group.objects.create(title='Группа', slug='admin_group',
+                                         description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_posts(self, count):
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create(username=f'admin_author_{i}')
+            post = Post.objects.create(author=author, group=self.group,
+                                       text=f'Пост {i}')
+            Comment.objects.create(post=post, author=author,
+                                   text='Комментарий')
+
+    def changelist_queries(self, model, data=None):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for model in ('post', 'comment', 'follow'):
+            with self.subTest(model=model):
+                self.add_posts(1)
+                few = len(self.changelist_queries(model))
+                self.add_posts(5)
+                self.assertEqual(len(self.changelist_queries(model)), few)
+
+    def test_unfiltered_changelist_count_is_bounded(self):
+        self.add_posts(3)
+        queries = self.changelist_queries('post')
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertTrue(all('LIMIT' in sql for sql in counts), counts)
+
+    def test_unfiltered_count_skips_deleted_rows(self):
+        self.add_posts(3)
+        Post.objects.order_by('pk').first().delete()
+        posts = Post.objects.all()
+        self.assertEqual(EstimatedCountPaginator(posts, 10).count, 2)
+        with self.settings(ADMIN_COUNT_LIMIT=2):
+            self.assertEqual(EstimatedCountPaginator(posts, 10).count,
+                             posts.order_by('pk').last().pk)
+
+    def test_filtered_count_is_bounded(self):
+        self.add_posts(3)
+        posts = Post.objects.filter(group=self.group)
+        with self.settings(ADMIN_COUNT_LIMIT=2):
+            self.assertEqual(EstimatedCountPaginator(posts, 10).count, 2)
+        self.assertEqual(EstimatedCountPaginator(posts, 10).count, 3)
+
+    def test_date_hierarchy_and_search(self):
+        self.add_posts(2)
+        url = reverse('admin:posts_post_changelist')
+        year = Post.objects.first().pub_date.year
+        response = self.client.get(url, {'pub_date__year': year})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get(url, {'q': 'admin_author_1'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [Post.objects.get(text='Пост 1')])
+
+    def test_change_forms_use_autocomplete(self):
+        self.add_posts(1)
+        for model, obj, fields in (
+                ('post', Post.objects.first(), ('author', 'group')),
+                ('comment', Comment.objects.first(), ('author', 'post'))):
+            response = self.client.get(
+                reverse(f'admin:posts_{model}_change', args=(obj.pk,)))
+            form = response.context['adminform'].form
+            for field in fields:
+                with self.subTest(model=model, field=field):
+                    self.assertIsInstance(form.fields[field].widget.widget,
+                                          AutocompleteSelect)
@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ..benchmarks import measure_requests, percentile, seed_data
+from ..models import Comment, FeedEntry, Follow, Post
+
+
+class BenchmarkHelpersTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_seed_data_volumes(self):
+        user_ids, group_ids, post_ids = seed_data(
+            users=5, groups=2, posts=20, comments=10, follows=2)
+        self.assertEqual((len(user_ids), len(group_ids), len(post_ids)),
+                         (5, 2, 20))
+        self.assertEqual(Post.objects.count(), 20)
+        self.assertEqual(Comment.objects.count(), 10)
+        self.assertEqual(Follow.objects.count(), 10)
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_measure_requests(self):
+        seed_data(users=2, groups=1, posts=3, comments=0, follows=1)
+        stats = measure_requests(
+            self.client, [('get', reverse('posts:index'), {})] * 3)
+        self.assertEqual(stats['requests'], 3)
+        self.assertGreater(stats['queries'], 0)
+        self.assertGreater(stats['bytes'], 0)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
@@ -0,0 +1,132 @@
+from io import StringIO
+
+from django.core import serializers
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User, UserStats
+
+
+class CountersTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='counted_author')
+        cls.reader = User.objects.create(username='counted_reader')
+        cls.group = Group.objects.create(title='Группа', slug='counted',
+                                         description='Описание')
+        cls.other_group = Group.objects.create(title='Другая',
+                                               slug='counted_other',
+                                               description='Описание')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Пост')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+        post.group = self.other_group
+        post.save()
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+        post.delete()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.other_group.posts_count, 0)
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_stale_save_keeps_counters(self):
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Пост')
+        group = Group.objects.get(pk=self.group.pk)
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Второй пост')
+        post.text = 'Новый текст'
+        post.save()
+        group.description = 'Новое описание'
+        group.save()
+        post.refresh_from_db()
+        group.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(group.description, 'Новое описание')
+        self.assertEqual(group.posts_count, 2)
+
+    def test_save_of_deleted_row_inserts_it(self):
+        group = Group.objects.create(title='Удалённая', slug='counted_gone',
+                                     description='Описание')
+        Group.objects.filter(pk=group.pk).delete()
+        group.description = 'Новое описание'
+        group.save()
+        self.assertEqual(Group.objects.get(pk=group.pk).description,
+                         'Новое описание')
+
+    def test_loaddata_keeps_dumped_counters(self):
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Пост')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        dump = serializers.serialize('json', [
+            self.group, self.stats(self.author), self.stats(self.reader),
+            post, comment, follow])
+        follow.delete()
+        post.delete()
+        for obj in serializers.deserialize('json', dump):
+            obj.save()
+        self.group.refresh_from_db()
+        self.assertEqual(Post.objects.get().comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Post.objects.update(comments_count=7)
+        Group.objects.update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        call_command('recount', stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+
+    def test_profile_renders_counters(self):
+        Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(
+            reverse('posts:profile', args=[self.author.username]))
+        self.assertEqual(response.context['posts_count'], 1)
+        self.assertEqual(response.context['followers_count'], 1)
+        self.assertEqual(response.context['following_count'], 0)
@@ -0,0 +1,268 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..feeds import (FEED_IDS_KEY, GENERATION_KEY, INDEX_FEED,
+                     POST_OBJECT_KEY, CachedFeed, feed_members, follow_feed,
+                     follow_posts, get_generations, group_feed,
+                     versioned_follow_feed, with_feed_fields)
+from ..models import FeedEntry, Follow, Group, Post, PulledAuthor, User
+
+
+class FollowFeedTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='feed_author')
+        cls.reader = User.objects.create(username='feed_reader')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Пост до подписки')
+
+    def feed_posts(self):
+        return list(FeedEntry.objects.filter(user=self.reader)
+                    .values_list('post_id', flat=True))
+
+    def test_follow_backfills_and_unfollow_retracts(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed_posts(), [self.old_post.pk])
+        follow.delete()
+        self.assertEqual(self.feed_posts(), [])
+
+    def test_new_post_pushed_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.feed_posts(), [new_post.pk, self.old_post.pk])
+        new_post.delete()
+        self.assertEqual(self.feed_posts(), [self.old_post.pk])
+
+    @override_settings(FEED_MAX_ENTRIES=2, FEED_TRIM_SLACK=0)
+    def test_feed_is_capped(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(author=self.author, text=f'Пост {i}')
+                 for i in range(3)]
+        self.assertEqual(self.feed_posts(), [posts[2].pk, posts[1].pk])
+
+    @override_settings(FEED_MAX_ENTRIES=2, FEED_TRIM_SLACK=2)
+    def test_feed_trimmed_after_slack(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(author=self.author, text=f'Пост {i}')
+                 for i in range(3)]
+        self.assertEqual(len(self.feed_posts()), 4)
+        posts.append(Post.objects.create(author=self.author, text='Пост'))
+        self.assertEqual(self.feed_posts(), [posts[3].pk, posts[2].pk])
+
+    def test_push_queries_do_not_grow_with_followers(self):
+        def push_queries():
+            with CaptureQueriesContext(connection) as queries:
+                Post.objects.create(author=self.author, text='Пост')
+            return len(queries)
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        baseline = push_queries()
+        for i in range(5):
+            Follow.objects.create(
+                user=User.objects.create(username=f'follower_{i}'),
+                author=self.author)
+        self.assertEqual(push_queries(), baseline)
+
+    def test_rebuild_feeds_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(self.feed_posts(), [self.old_post.pk])
+
+
+@override_settings(FEED_PULL_THRESHOLD=2)
+class HybridFeedTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.star = User.objects.create(username='star_author')
+        cls.author = User.objects.create(username='plain_author')
+        cls.readers = [User.objects.create(username=f'reader_{i}')
+                       for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_author_above_threshold_is_pulled(self):
+        Post.objects.create(author=self.star, text='Старый пост')
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.star)
+        self.assertTrue(PulledAuthor.objects.filter(pk=self.star.pk).exists())
+        self.assertFalse(
+            FeedEntry.objects.filter(post__author=self.star).exists())
+        Post.objects.create(author=self.star, text='Новый пост')
+        self.assertFalse(
+            FeedEntry.objects.filter(post__author=self.star).exists())
+
+    def test_push_back_backfills_after_commit(self):
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.star)
+        Post.objects.create(author=self.star, text='Пост')
+        Follow.objects.filter(user=self.readers[0]).delete()
+        self.assertFalse(PulledAuthor.objects.filter(pk=self.star.pk).exists())
+        # Раскладка ждёт коммита, которого в TestCase нет.
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_follow_page_merges_pushed_and_pulled_posts(self):
+        reader = self.readers[0]
+        for user in self.readers:
+            Follow.objects.create(user=user, author=self.star)
+        Follow.objects.create(user=reader, author=self.author)
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {i}')
+            for i, author in enumerate([self.star, self.author] * 7)
+        ]
+        client = Client()
+        client.force_login(reader)
+        response = client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, len(posts))
+        self.assertTrue(page_obj.is_cursor)
+        self.assertEqual(list(page_obj), posts[::-1][:len(page_obj)])
+        cursor = page_obj.next_cursor
+        response = client.get(reverse('posts:follow_index')
+                              + f'?after={cursor}')
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[::-1][len(page_obj):])
+
+
+@override_settings(FEED_PULL_THRESHOLD=2, THUMBNAIL_WORKERS=0)
+class PushBackTests(TransactionTestCase):
+
+    def test_author_below_threshold_is_pushed_back(self):
+        star = User.objects.create(username='star_author')
+        readers = [User.objects.create(username=f'reader_{i}')
+                   for i in range(2)]
+        for reader in readers:
+            Follow.objects.create(user=reader, author=star)
+        post = Post.objects.create(author=star, text='Пост')
+        Follow.objects.filter(user=readers[0]).delete()
+        self.assertFalse(PulledAuthor.objects.filter(pk=star.pk).exists())
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('user_id', 'post_id')),
+            [(readers[1].pk, post.pk)])
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class CachedFeedTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='cached_feed_author')
+        cls.reader = User.objects.create(username='cached_feed_reader')
+        cls.group = Group.objects.create(title='Группа', slug='cached_feed',
+                                         description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [Post.objects.create(author=cls.author, group=cls.group,
+                                         text=f'Пост {i}')
+                     for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def feed(self, feed=INDEX_FEED, posts=None):
+        return CachedFeed(feed, with_feed_fields(posts or Post.objects.all()))
+
+    def page(self, feed=INDEX_FEED, posts=None):
+        """Первая страница ленты и запросы, которыми она собрана."""
+        with CaptureQueriesContext(connection) as queries:
+            page = self.feed(feed, posts)[:10]
+        return page, queries.captured_queries
+
+    def cached_ids(self, feed):
+        version, = get_generations([feed_members(feed)])
+        return cache.get(FEED_IDS_KEY.format(feed, version))
+
+    def test_page_served_from_cache(self):
+        page, queries = self.page()
+        self.assertEqual([post.pk for post in page],
+                         [post.pk for post in reversed(self.posts)])
+        self.assertEqual(len(queries), 2)
+        page, queries = self.page()
+        self.assertEqual(queries, [])
+        self.assertEqual(page[0].author.username, self.author.username)
+        self.assertEqual(page[0].group.slug, self.group.slug)
+
+    def test_edit_touches_one_post(self):
+        self.page()
+        post = self.posts[1]
+        post.text = 'Новый текст'
+        post.save()
+        self.assertIsNone(cache.get(POST_OBJECT_KEY.format(post.pk)))
+        self.assertIsNotNone(cache.get(POST_OBJECT_KEY.format(
+            self.posts[0].pk)))
+        page, queries = self.page()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(page[1].text, 'Новый текст')
+
+    def test_new_and_deleted_posts_change_lists_without_reading(self):
+        feeds = (
+            (INDEX_FEED, None),
+            (group_feed(self.group.pk), self.group.posts.all()),
+        )
+        for feed, posts in feeds:
+            self.page(feed, posts)
+        new_post = Post.objects.create(author=self.author, group=self.group,
+                                       text='Новый пост')
+        for feed, posts in feeds:
+            with self.subTest(feed=feed):
+                self.assertEqual(self.cached_ids(feed)[0], new_post.pk)
+                page, _ = self.page(feed, posts)
+                self.assertEqual(page[0].pk, new_post.pk)
+        new_post.delete()
+        for feed, posts in feeds:
+            with self.subTest(feed=feed):
+                self.assertNotIn(new_post.pk, self.cached_ids(feed))
+                page, queries = self.page(feed, posts)
+                self.assertEqual(queries, [])
+
+    def test_follow_feed_version_changes_with_followed_authors(self):
+        def follow_version():
+            _, authors = follow_posts(self.reader)
+            return versioned_follow_feed(self.reader.pk, authors)
+
+        other = User.objects.create(username='cached_feed_other')
+        version = follow_version()
+        follow_key = GENERATION_KEY.format(
+            feed_members(follow_feed(self.reader.pk)))
+        generation = cache.get(follow_key)
+        Post.objects.create(author=other, text='Чужой пост')
+        self.assertEqual(follow_version(), version)
+        Post.objects.create(author=self.author, text='Новый пост')
+        self.assertNotEqual(follow_version(), version)
+        # Пост автора не пишет ключей в ленты его подписчиков.
+        self.assertEqual(cache.get(follow_key), generation)
+        version = follow_version()
+        Follow.objects.create(user=self.reader, author=other)
+        self.assertNotEqual(follow_version(), version)
+
+    def test_renamed_group_and_author_are_refreshed(self):
+        self.page()
+        self.group.slug = 'renamed_feed'
+        self.group.save()
+        self.author.username = 'renamed_feed_author'
+        self.author.save()
+        page, _ = self.page()
+        self.assertEqual(page[0].group.slug, 'renamed_feed')
+        self.assertEqual(page[0].author.username, 'renamed_feed_author')
+
+    @override_settings(FEED_CACHED_IDS=2, NUMBER_OF_POSTS=2)
+    def test_pages_beyond_cached_ids_read_from_database(self):
+        feed = self.feed()
+        self.assertEqual(feed.count(), 3)
+        self.assertEqual([post.pk for post in feed[1:3]],
+                         [self.posts[1].pk, self.posts[0].pk])
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [self.posts[0].pk])
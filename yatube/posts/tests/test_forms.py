@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -160,9 +161,10 @@ class PostFormTests(TestCase):
             follow=True
         )
         self.assertEqual(Post.objects.count(), post_count + 1)
+        checksum = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
-                image='posts/small.gif'
+                image=f'posts/{checksum[:2]}/{checksum}.gif'
             ).exists()
         )
 
@@ -0,0 +1,66 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+FEED_TABLES = re.compile(r'\bposts_(post|comment|follow)\b')
+FULL_SCAN = re.compile(
+    r'^SCAN (TABLE )?posts_(post|comment|follow)\b(?!.*USING)')
+
+
+@skipUnlessDBFeature('supports_explaining_query_execution')
+class FeedIndexesTests(TestCase):
+    """Запросы страниц к постам, комментариям и подпискам идут по индексам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='index_author')
+        cls.reader = User.objects.create(username='index_reader')
+        cls.group = Group.objects.create(title='Группа', slug='index_group',
+                                         description='Описание')
+        cls.posts = [Post.objects.create(author=cls.author, group=cls.group,
+                                         text=f'Пост {i}') for i in range(3)]
+        Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def query_plans(self, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, data)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or not FEED_TABLES.search(sql):
+                    continue
+                plans[sql] = [
+                    row[-1] for row in cursor.execute(
+                        connection.ops.explain_query_prefix() + ' ' + sql)
+                ]
+        return plans
+
+    def test_feed_queries_use_indexes(self):
+        pages = (
+            (reverse('posts:index'), None),
+            (reverse('posts:index'), {'after': ''}),
+            (reverse('posts:group_list', args=[self.group.slug]), None),
+            (reverse('posts:profile', args=[self.author.username]), None),
+            (reverse('posts:post', args=[self.posts[0].pk]), None),
+            (reverse('posts:follow_index'), None),
+        )
+        for url, data in pages:
+            for sql, plan in self.query_plans(url, data).items():
+                with self.subTest(url=url, data=data, sql=sql):
+                    self.assertFalse(
+                        [step for step in plan if FULL_SCAN.search(step)
+                         or 'TEMP B-TREE FOR ORDER BY' in step], plan)
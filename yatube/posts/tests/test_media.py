@@ -0,0 +1,159 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from ..media import delete_if_unreferenced, image_storage
+from ..models import Post, StoredImage, User
+from ..thumbnails import prefetch_thumbnails, render_post_thumbnails
+from .test_thumbnails import unique_image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def upload(content):
+    return SimpleUploadedFile('image.gif', content, 'image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class StoredImageRefsTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='media_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def refs(self, name):
+        return (StoredImage.objects.filter(name=name)
+                .values_list('refs', flat=True).first())
+
+    def test_identical_uploads_share_file(self):
+        first = Post.objects.create(author=self.user, text='Первый',
+                                    image=upload(b'GIF89a-same'))
+        second = Post.objects.create(author=self.user, text='Второй',
+                                     image=upload(b'GIF89a-same'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.refs(first.image.name), 2)
+
+        shared = first.image.name
+        first.image = upload(b'GIF89a-other')
+        first.save()
+        self.assertEqual(self.refs(shared), 1)
+        self.assertEqual(self.refs(first.image.name), 1)
+
+        second.delete()
+        self.assertEqual(self.refs(shared), 0)
+
+    def test_reused_file_restored_after_concurrent_delete(self):
+        first = Post.objects.create(author=self.user, text='Первый',
+                                    image=upload(b'GIF89a-race'))
+        name = first.image.name
+        first.delete()
+        storage = image_storage()
+        save = storage._save
+
+        def save_then_release(*args):
+            # Последняя ссылка снимается сразу после проверки
+            # существования файла.
+            saved = save(*args)
+            delete_if_unreferenced(saved)
+            return saved
+
+        with mock.patch.object(storage, '_save', save_then_release):
+            second = Post.objects.create(author=self.user, text='Второй',
+                                         image=upload(b'GIF89a-race'))
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class MediaCleanupTests(TransactionTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='cleanup_author')
+        self.storage = image_storage()
+
+    def create_post(self):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=unique_image())
+        render_post_thumbnails(post.pk)
+        return post
+
+    def thumbnail_names(self, post):
+        prefetch_thumbnails([post])
+        return [image.name for image in post.thumbnails.values()]
+
+    def assertGone(self, names):
+        for name in names:
+            with self.subTest(name=name):
+                self.assertFalse(self.storage.exists(name))
+
+    def test_delete_and_edit_remove_files(self):
+        post = self.create_post()
+        names = [post.image.name, *self.thumbnail_names(post)]
+        post.image = unique_image()
+        post.save()
+        self.assertGone(names)
+        names = [post.image.name]
+        post.delete()
+        self.assertGone(names)
+
+    def test_shared_file_kept_while_referenced(self):
+        post = self.create_post()
+        Post.objects.create(author=self.user, text='Копия',
+                            image=post.image.name)
+        post.delete()
+        self.assertTrue(self.storage.exists(post.image.name))
+
+    def test_media_gc(self):
+        kept = self.create_post()
+        orphan = self.create_post()
+        names = [orphan.image.name, *self.thumbnail_names(orphan)]
+        Post.objects.filter(pk=orphan.pk).update(image='')
+        StoredImage.objects.filter(name=orphan.image.name).delete()
+        stray = self.storage.save(
+            f'{sorl_settings.THUMBNAIL_PREFIX}00/00/stray.jpg',
+            ContentFile(b'stray'))
+
+        output = StringIO()
+        call_command('media_gc', dry_run=True, min_age=0, stdout=output)
+        self.assertIn('оригиналов 1', output.getvalue())
+        for name in names:
+            self.assertTrue(self.storage.exists(name))
+
+        call_command('media_gc', min_age=0, stdout=StringIO())
+        self.assertGone(names + [stray])
+        self.assertTrue(self.storage.exists(kept.image.name))
+        self.assertTrue(all(self.storage.exists(name)
+                            for name in self.thumbnail_names(kept)))
+
+    def test_media_gc_keeps_uploads_in_flight(self):
+        # Файл уже в хранилище, а пост с ним ещё не закоммичен.
+        fresh = self.storage.save('posts/fresh.png', unique_image())
+        counted = self.storage.save('posts/counted.png', unique_image())
+        StoredImage.objects.create(name=counted, refs=1)
+        call_command('media_gc', stdout=StringIO())
+        self.assertTrue(self.storage.exists(fresh))
+        call_command('media_gc', min_age=0, stdout=StringIO())
+        self.assertGone([fresh])
+        self.assertTrue(self.storage.exists(counted))
@@ -0,0 +1,64 @@
+import pickle
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..feeds import with_feed_fields
+from ..models import Group, Post, User
+from ..records import AuthorRecord, PostRecord, post_records
+
+
+class PostRecordTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='record_author',
+                                         first_name='Лев',
+                                         last_name='Толстой')
+        cls.group = Group.objects.create(title='Группа', slug='records',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Текст', image='posts/pic.gif')
+        cls.plain_post = Post.objects.create(author=cls.author,
+                                             text='Без группы')
+
+    def test_records_match_model_instances(self):
+        with self.assertNumQueries(1):
+            records = post_records(Post.objects.order_by('pk'))
+        instances = list(with_feed_fields(Post.objects.order_by('pk')))
+        self.assertEqual(records, instances)
+        record, plain = records
+        self.assertIsInstance(record, PostRecord)
+        self.assertEqual(record.id, self.post.pk)
+        self.assertEqual(record.pub_date, self.post.pub_date)
+        self.assertEqual(record.author, self.author)
+        self.assertEqual(record.author.get_full_name(),
+                         self.author.get_full_name())
+        self.assertEqual(record.group, self.group)
+        self.assertEqual(record.group.slug, self.group.slug)
+        self.assertEqual(record.image.url, self.post.image.url)
+        self.assertIsNone(plain.group)
+        self.assertFalse(plain.image)
+        # Равенство учитывает модель, а не только pk.
+        self.assertNotEqual(record.author, Group(pk=self.author.pk))
+        self.assertNotEqual(AuthorRecord(self.author.pk, '', '', ''),
+                            record.group)
+
+    def test_records_survive_pickling(self):
+        record, = post_records(Post.objects.filter(pk=self.post.pk))
+        record.thumbnails = {}
+        restored = pickle.loads(pickle.dumps(record))
+        self.assertEqual(restored, record)
+        self.assertEqual(restored.thumbnails, {})
+        self.assertEqual(restored.author.username, self.author.username)
+        self.assertEqual(hash(restored), hash(self.post))
+
+    def test_bench_records_command(self):
+        out = StringIO()
+        call_command('bench_records', repeat=1, stdout=out)
+        output = out.getvalue()
+        for size in ('10', '50', '100'):
+            self.assertIn(f' {size} ', output)
+        self.assertIn('records', output)
@@ -0,0 +1,136 @@
+import re
+
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from ..models import Group, Post, SearchEntry, SearchTerm, User
+from ..search import rebuild_index, search_posts, tokenize
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_(post|searchentry)\b(?!.*USING)')
+
+
+class SearchIndexTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='poet',
+                                         first_name='Фёдор',
+                                         last_name='Тютчев')
+        cls.group = Group.objects.create(title='Лирика', slug='lyrics',
+                                         description='Описание')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query):
+        return list(search_posts(query).order_by('-found_date', '-found_id'))
+
+    def test_tokenize_normalizes_words(self):
+        self.assertEqual(tokenize('Ёлка, ЁЖИК и 42!'),
+                         ['елка', 'ежик', '42'])
+
+    def test_index_follows_post_changes(self):
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Люблю грозу в начале мая')
+        self.assertEqual(self.found('ГРОЗУ'), [post])
+        self.assertEqual(self.found('лирика'), [post])
+        self.assertEqual(self.found('тютчев'), [post])
+        self.assertEqual(self.found('гроза мая'), [])
+
+        post.text = 'Весенний гром'
+        post.group = None
+        post.save()
+        self.assertEqual(self.found('грозу'), [])
+        self.assertEqual(self.found('лирика'), [])
+        self.assertEqual(self.found('весенний гром'), [post])
+        self.assertEqual(SearchTerm.objects.get(term='грозу').posts_count, 0)
+
+        post.delete()
+        self.assertEqual(self.found('весенний'), [])
+        self.assertEqual(
+            SearchTerm.objects.get(term='весенний').posts_count, 0)
+        self.assertFalse(SearchEntry.objects.exists())
+
+    def test_renaming_author_and_group_reindexes_posts(self):
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Пост')
+        self.group.title = 'Поэзия'
+        self.group.save()
+        self.author.last_name = 'Фет'
+        self.author.save()
+        self.assertEqual(self.found('поэзия фет'), [post])
+        self.assertEqual(self.found('лирика'), [])
+        self.group.delete()
+        self.assertEqual(self.found('поэзия'), [])
+
+    def test_results_are_newest_first_and_match_all_words(self):
+        posts = [Post.objects.create(author=self.author,
+                                     text=f'Гроза номер {i}')
+                 for i in range(3)]
+        Post.objects.create(author=self.author, text='Тишина номер')
+        self.assertEqual(self.found('гроза номер'), posts[::-1])
+
+    def test_rebuild_matches_incremental_index(self):
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Люблю грозу')
+        Post.objects.create(author=self.author, text='Грозу в мае')
+        expected_entries = set(
+            SearchEntry.objects.values_list('term', 'post_id'))
+        expected_terms = set(SearchTerm.objects.filter(posts_count__gt=0)
+                             .values_list('term', 'posts_count'))
+        self.assertEqual(rebuild_index(),
+                         (len(expected_terms), len(expected_entries)))
+        self.assertEqual(
+            set(SearchEntry.objects.values_list('term', 'post_id')),
+            expected_entries)
+        self.assertEqual(
+            set(SearchTerm.objects.values_list('term', 'posts_count')),
+            expected_terms)
+
+    def test_admin_search_uses_index(self):
+        post = Post.objects.create(author=self.author, text='Люблю грозу')
+        Post.objects.create(author=self.author, text='Грозовой фронт')
+        request = RequestFactory().get('/')
+        queryset, use_distinct = site._registry[Post].get_search_results(
+            request, Post.objects.all(), 'грозу')
+        self.assertEqual(list(queryset), [post])
+        self.assertFalse(use_distinct)
+
+    def test_search_page_paginates_by_cursor(self):
+        posts = [Post.objects.create(author=self.author,
+                                     text=f'Гроза {i}') for i in range(3)]
+        url = reverse('posts:search')
+        with override_settings(NUMBER_OF_POSTS=2):
+            response = self.client.get(url, {'q': 'гроза'})
+            page_obj = response.context['page_obj']
+            self.assertEqual(list(page_obj), posts[:0:-1])
+            self.assertContains(
+                response, f'q=%D0%B3%D1%80%D0%BE%D0%B7%D0%B0&amp;after='
+                          f'{page_obj.next_cursor}')
+            response = self.client.get(
+                url, {'q': 'гроза', 'after': page_obj.next_cursor})
+        self.assertEqual(list(response.context['page_obj']), posts[:1])
+        response = self.client.get(url, {'q': 'нет такого'})
+        self.assertEqual(list(response.context['page_obj']), [])
+        self.assertContains(response, 'Ничего не найдено')
+
+    def test_search_reads_entries_through_index(self):
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Гроза мая {i}')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:search'), {'q': 'гроза мая'})
+        sql = next(query['sql'] for query in queries
+                   if 'posts_searchentry' in query['sql']
+                   and 'posts_post' in query['sql'])
+        with connection.cursor() as cursor:
+            plan = [row[-1] for row in cursor.execute(
+                connection.ops.explain_query_prefix() + ' ' + sql)]
+        self.assertFalse([step for step in plan if FULL_SCAN.search(step)],
+                         plan)
+        self.assertFalse([step for step in plan if 'TEMP B-TREE' in step],
+                         plan)
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from ..feeds import INDEX_FEED, get_generations
+from ..models import Post, User
+from ..thumbnails import (THUMBNAIL_LOCK_KEY, prefetch_thumbnails,
+                          render_in_worker, render_post_thumbnails,
+                          thumbnail_sizes)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def unique_image(name='thumb.png'):
+    """Картинка с новым содержимым: одинаковые файлы хранятся один раз."""
+    image = Image.new('RGB', (4, 4), tuple(os.urandom(3)))
+    content = BytesIO()
+    image.save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailsTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='thumb_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=unique_image())
+
+    def ready_thumbnail(self, post=None):
+        post = Post.objects.get(pk=(post or self.post).pk)
+        prefetch_thumbnails([post])
+        return post.thumbnails[settings.POST_THUMBNAIL_FALLBACK]
+
+    def test_template_never_renders_thumbnail(self):
+        self.assertIsNone(self.ready_thumbnail())
+
+    def test_render_post_thumbnails(self):
+        generation = get_generations([INDEX_FEED])
+        self.assertEqual(render_post_thumbnails(self.post.pk),
+                         len(thumbnail_sizes()))
+        thumbnail = self.ready_thumbnail()
+        self.assertIsNotNone(thumbnail)
+        self.assertTrue(thumbnail.exists())
+        self.assertNotEqual(get_generations([INDEX_FEED]), generation)
+        self.assertEqual(render_post_thumbnails(self.post.pk), 0)
+
+    def test_locked_thumbnail_is_not_rendered_twice(self):
+        for size in thumbnail_sizes():
+            cache.add(THUMBNAIL_LOCK_KEY.format(self.post.image.name, size),
+                      True)
+        self.assertEqual(render_post_thumbnails(self.post.pk), 0)
+        self.assertIsNone(self.ready_thumbnail())
+
+    def test_render_thumbnails_command(self):
+        call_command('render_thumbnails', workers=0, stdout=StringIO())
+        self.assertIsNotNone(self.ready_thumbnail())
+
+    def test_page_thumbnails_fetched_in_one_query(self):
+        posts = [self.post] + [
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}',
+                image=unique_image())
+            for i in range(3)
+        ]
+        for post in posts:
+            render_post_thumbnails(post.pk)
+        cache.clear()
+        page = list(Post.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_thumbnails(page)
+        self.assertEqual(len(queries), 1)
+        fallback = settings.POST_THUMBNAIL_FALLBACK
+        self.assertTrue(all(post.thumbnails[fallback] for post in page))
+        page = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            prefetch_thumbnails(page)
+
+    def test_replaced_image_forgotten(self):
+        render_post_thumbnails(self.post.pk)
+        old_thumbnail = self.ready_thumbnail()
+        self.post.image = unique_image()
+        self.post.save()
+        self.assertIsNone(self.ready_thumbnail())
+        render_post_thumbnails(self.post.pk)
+        self.assertNotEqual(self.ready_thumbnail().name, old_thumbnail.name)
+
+    def test_post_page_renders_responsive_image(self):
+        render_post_thumbnails(self.post.pk)
+        response = self.client.get(reverse('posts:post',
+                                           args=[self.post.pk]))
+        content = response.content.decode()
+        for width in (480, 960):
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', content)
+        for attribute in ('sizes="', 'width="960"', 'height="339"',
+                          'loading="lazy"'):
+            with self.subTest(attribute=attribute):
+                self.assertIn(attribute, content)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ScheduleThumbnailsTests(TransactionTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=User.objects.create(username='pending_author'),
+            text='Пост с картинкой', image=unique_image())
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_pending_post_scheduled_once(self):
+        executor = mock.Mock()
+        future = executor.submit.return_value
+
+        def finish_jobs():
+            for (callback,), _ in future.add_done_callback.call_args_list:
+                callback(future)
+
+        self.addCleanup(finish_jobs)
+        with mock.patch('posts.thumbnails.get_executor',
+                        return_value=executor):
+            for _ in range(3):
+                prefetch_thumbnails([Post.objects.get(pk=self.post.pk)])
+            executor.submit.assert_called_once_with(render_in_worker,
+                                                    self.post.pk)
+            finish_jobs()
+            prefetch_thumbnails([Post.objects.get(pk=self.post.pk)])
+        self.assertEqual(executor.submit.call_count, 2)
@@ -5,11 +5,15 @@ from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from ..forms import PostForm
-from ..models import Follow, Group, Post, User
+from ..models import Comment, Follow, Group, Post, User
+from ..paginators import CachedCountPaginator
+from ..records import PostRecord
 
 
 @override_settings(MEDIA_ROOT=os.path.join(settings.BASE_DIR,
@@ -42,6 +46,7 @@ class PostsViewsTests(TestCase):
         super().tearDownClass()
 
     def setUp(self) -> None:
+        cache.clear()
         self.auth_client = Client()
         self.auth_client.force_login(self.user)
 
@@ -89,7 +94,7 @@ class PostsViewsTests(TestCase):
     def test_home_page_show_correct_context(self):
         context = self.get_context_with_page_obj('posts:index')
         self.assertTrue(len(context['page_obj']) > 0)
-        self.assertIsInstance(context['page_obj'][0], Post)
+        self.assertIsInstance(context['page_obj'][0], PostRecord)
         self.review_post(context, is_post=False)
 
     def test_group_page_show_correct_context(self):
@@ -208,16 +213,31 @@ class PostsViewsTests(TestCase):
 
     def test_index_page_cash(self):
         index_content = self.get_content_by_reverse('posts:index')
-        Post.objects.create(
-            text='New_text',
-            author=PostsViewsTests.user
-        )
+        Post.objects.filter(pk=PostsViewsTests.post.pk).update(
+            text='Изменено в обход сигналов')
         content_index_page_cash = self.get_content_by_reverse('posts:index')
         self.assertEqual(index_content, content_index_page_cash)
         cache.clear()
         content_after_cache = self.get_content_by_reverse('posts:index',)
         self.assertNotEqual(index_content, content_after_cache)
 
+    def test_index_page_cache_invalidated_by_new_post(self):
+        index_content = self.get_content_by_reverse('posts:index')
+        Post.objects.create(
+            text='New_text',
+            author=PostsViewsTests.user
+        )
+        content_after_post = self.get_content_by_reverse('posts:index')
+        self.assertNotEqual(index_content, content_after_post)
+        self.assertIn('New_text', content_after_post.decode())
+
+    def test_post_page_cache_invalidated_by_comment(self):
+        url = reverse('posts:post', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Свежий комментарий')
+        self.assertContains(self.client.get(url), 'Свежий комментарий')
+
     def create_new_auth_client(self):
         self.read_user = User.objects.create(username='user2')
         self.authorized_reader_client = Client()
@@ -291,6 +311,9 @@ class PaginatorViewsTest(TestCase):
         block = Post(author=cls.user, group=cls.group, text='Тестовый текст')
         cls.post = Post.objects.bulk_create([block] * cls.num_posts)
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_num_settings_records(self):
         response = self.client.get(reverse('posts:index'))
         length = len(response.context.get('page_obj').object_list)
@@ -301,3 +324,291 @@ class PaginatorViewsTest(TestCase):
         length = len(response.context.get('page_obj').object_list)
         num_posts = PaginatorViewsTest.num_posts - settings.NUMBER_OF_POSTS
         self.assertEqual(length, num_posts)
+
+
+# Тесты смотрят в контекст представления, кэш страниц им мешает.
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class CursorPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Курсорный автор')
+        cls.num_posts = settings.NUMBER_OF_POSTS * 2 + 3
+        Post.objects.bulk_create([
+            Post(author=cls.user, text=f'Текст {i}')
+            for i in range(cls.num_posts)
+        ])
+
+    def setUp(self):
+        # bulk_create не сдвигает поколения: страницы прошлых тестов живы.
+        cache.clear()
+
+    def get_page_obj(self, query=''):
+        response = self.client.get(reverse('posts:index') + query)
+        return response.context['page_obj']
+
+    def test_walk_all_pages_by_cursor(self):
+        page_obj = self.get_page_obj('?after=')
+        seen = list(page_obj.object_list)
+        while page_obj.has_next():
+            page_obj = self.get_page_obj(f'?after={page_obj.next_cursor}')
+            seen.extend(page_obj.object_list)
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_page_stable_when_new_post_arrives(self):
+        with self.settings(CURSOR_PAGINATION=True):
+            first_page = self.get_page_obj()
+        cursor = first_page.next_cursor
+        second_page = list(self.get_page_obj(f'?after={cursor}'))
+        Post.objects.create(author=self.user, text='Свежий пост')
+        self.assertEqual(list(self.get_page_obj(f'?after={cursor}')),
+                         second_page)
+
+    def test_before_returns_previous_page(self):
+        first_page = self.get_page_obj('?after=')
+        second_page = self.get_page_obj(f'?after={first_page.next_cursor}')
+        previous = self.get_page_obj(
+            f'?before={second_page.previous_cursor}')
+        self.assertEqual(list(previous), list(first_page))
+        self.assertFalse(previous.has_previous())
+
+    def test_broken_cursor_shows_first_page(self):
+        first_page = self.get_page_obj('?after=')
+        self.assertEqual(list(self.get_page_obj('?after=broken')),
+                         list(first_page))
+
+    def test_cursor_links_in_paginator(self):
+        response = self.client.get(reverse('posts:index') + '?after=')
+        page_obj = response.context['page_obj']
+        self.assertContains(response, f'?after={page_obj.next_cursor}')
+        self.assertNotContains(response, '?page=')
+
+
+# Полный список id сам даёт число постов: COUNT(*) нужен лентам длиннее.
+@override_settings(PAGE_CACHE_TIMEOUT=0, FEED_CACHED_IDS=2)
+class CachedCountPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Считаемый автор')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for i in range(3):
+            Post.objects.create(author=cls.user, group=cls.group,
+                                text=f'Текст {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def count_on_page(self, reverse_name, kwargs=None):
+        url = reverse(reverse_name, kwargs=kwargs)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        count_queries = [query for query in queries.captured_queries
+                         if 'COUNT(' in query['sql']]
+        return response.context['page_obj'].paginator.count, count_queries
+
+    def test_count_is_cached(self):
+        pages = (
+            ('posts:index', None),
+            ('posts:group_list', {'slug': self.group.slug}),
+            ('posts:profile', {'username': self.user.username}),
+        )
+        for reverse_name, kwargs in pages:
+            with self.subTest(reverse_name=reverse_name):
+                count, queries = self.count_on_page(reverse_name, kwargs)
+                self.assertEqual(count, 3)
+                self.assertEqual(len(queries), 1)
+                count, queries = self.count_on_page(reverse_name, kwargs)
+                self.assertEqual(count, 3)
+                self.assertEqual(queries, [])
+
+    def test_count_follows_create_and_delete(self):
+        kwargs = {'slug': self.group.slug}
+        self.count_on_page('posts:group_list', kwargs)
+        new_post = Post.objects.create(author=self.user, group=self.group,
+                                       text='Новый пост')
+        count, queries = self.count_on_page('posts:group_list', kwargs)
+        self.assertEqual(count, 4)
+        self.assertEqual(queries, [])
+        new_post.group = None
+        new_post.save()
+        self.assertEqual(self.count_on_page('posts:group_list', kwargs)[0], 3)
+        Post.objects.filter(group=self.group).first().delete()
+        count, queries = self.count_on_page('posts:group_list', kwargs)
+        self.assertEqual(count, 2)
+        self.assertEqual(queries, [])
+
+    def test_elided_page_range(self):
+        paginator = CachedCountPaginator(list(range(200)), 10)
+        ellipsis = CachedCountPaginator.ELLIPSIS
+        page_numbers = (
+            (1, [1, 2, 3, ellipsis, 20]),
+            (10, [1, ellipsis, 8, 9, 10, 11, 12, ellipsis, 20]),
+            (20, [1, ellipsis, 18, 19, 20]),
+        )
+        for number, expected in page_numbers:
+            with self.subTest(number=number):
+                page = paginator.page(number)
+                self.assertEqual(page.elided_page_range, expected)
+
+
+class QueryCountViewsTest(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='query_author')
+        cls.reader = User.objects.create(username='query_reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def add_posts(self, total):
+        while Post.objects.count() < total:
+            post = Post.objects.create(author=self.author, group=self.group,
+                                       text='Тестовый текст')
+            commentator = User.objects.create(username=f'reader_{post.pk}')
+            Comment.objects.create(post=post, author=commentator,
+                                   text='Комментарий')
+            Comment.objects.create(post=post, author=self.author,
+                                   text='Ответ автора')
+
+    def pages(self):
+        post_id = Post.objects.latest('pub_date').pk
+        return (
+            (reverse('posts:index'), self.reader_client, 4),
+            (reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+             self.reader_client, 5),
+            (reverse('posts:profile',
+                     kwargs={'username': self.author.username}),
+             self.reader_client, 6),
+            (reverse('posts:post', kwargs={'post_id': post_id}),
+             self.reader_client, 4),
+            (reverse('posts:follow_index'), self.reader_client, 5),
+            (reverse('posts:post_create'), self.author_client, 3),
+            (reverse('posts:post_edit', kwargs={'post_id': post_id}),
+             self.author_client, 4),
+        )
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for total in (2, settings.NUMBER_OF_POSTS):
+            self.add_posts(total)
+            for url, client, queries in self.pages():
+                with self.subTest(url=url, total=total):
+                    cache.clear()
+                    with self.assertNumQueries(queries):
+                        client.get(url)
+
+
+class ConditionalGetTests(TestCase):
+    """Неизменившиеся страницы отдаются ответом 304 без отрисовки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='etag_author')
+        cls.reader = User.objects.create(username='etag_reader')
+        cls.group = Group.objects.create(title='Группа', slug='etag_group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Текст')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post', kwargs={'post_id': self.post.pk}),
+        )
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_page_is_not_modified(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url,
+                                               HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertLessEqual(len(queries), 1)
+
+    def assert_changed(self, change, urls):
+        etags = [self.reader_client.get(url)['ETag'] for url in urls]
+        change()
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.reader_client.get(url,
+                                                  HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_changes_invalidate_etag(self):
+        index, group, profile, post = self.urls()
+        self.assert_changed(
+            lambda: Post.objects.create(author=self.author,
+                                        group=self.group, text='Новый'),
+            (index, group, profile, post))
+        self.assert_changed(
+            lambda: Comment.objects.create(post=self.post,
+                                           author=self.reader,
+                                           text='Комментарий'),
+            (post,))
+        self.assert_changed(
+            lambda: Follow.objects.create(user=self.reader,
+                                          author=self.author),
+            (profile,))
+        self.assert_changed(
+            lambda: Group.objects.filter(pk=self.group.pk).first().save(),
+            (index, group, profile, post))
+
+    def rename(self, user):
+        def change():
+            user.first_name = 'Новое'
+            user.save()
+        return change
+
+    def test_rename_invalidates_etag(self):
+        index, group, profile, post = self.urls()
+        self.assert_changed(self.rename(self.author),
+                            (index, group, profile, post))
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.assert_changed(self.rename(self.reader), (post,))
+
+    def test_etag_depends_on_viewer(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.reader_client.get(url,
+                                                  HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.revalidate(self.reader_client,
+                                                 url).status_code, 304)
@@ -0,0 +1,236 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    KVStore as CachedDBKVStore)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.backends import TimedThumbnailBackend
+from core.lru import LRUCache
+from core.timing import measure
+
+from .feeds import bump_generations, post_display_feeds
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_LOCK_KEY = 'thumbnail_lock:{}:{}'
+
+_executor = None
+_executor_lock = threading.Lock()
+# Готовые миниатюры по имени картинки: {размер: ImageFile}.
+_ready = LRUCache(settings.THUMBNAIL_LRU_SIZE)
+# Поставленные в очередь и ещё не завершённые генерации: (id поста, имя).
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+class KVStore(CachedDBKVStore):
+    """Хранилище ключей sorl с пакетным чтением."""
+
+    def get_many(self, image_files):
+        """Словарь ``{ключ файла: ImageFile или None}`` за один проход.
+
+        Промахи кэша дочитываются из базы одним запросом.
+        """
+        raw_keys = {add_prefix(image_file.key): image_file.key
+                    for image_file in image_files}
+        values = self.cache.get_many(list(raw_keys))
+        missing = [key for key in raw_keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(key__in=missing)
+                         .values_list('key', 'value'))
+            fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(fetched,
+                                sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        return {
+            key: (None if values[raw_key] == EMPTY_VALUE
+                  else deserialize_image_file(values[raw_key]))
+            for raw_key, key in raw_keys.items()
+        }
+
+
+class PostThumbnailBackend(TimedThumbnailBackend):
+    """Бэкенд миниатюр, умеющий искать готовую миниатюру без её создания."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, который создал бы ``get_thumbnail``.
+
+        Параметры дополняются так же, как в ``get_thumbnail``, чтобы
+        имя файла совпало с созданным фоновой генерацией.
+        """
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Миниатюра из хранилища ключей sorl или None, если её ещё нет."""
+        with measure('thumbnail'):
+            return default.kvstore.get(
+                self.thumbnail_file(file_, geometry_string, **options))
+
+
+def thumbnail_sizes():
+    """Варианты из POST_THUMBNAILS, которые умеет кодировать Pillow."""
+    return {
+        size: (geometry, options)
+        for size, (geometry, options) in settings.POST_THUMBNAILS.items()
+        if options.get('format') != 'WEBP' or features.check('webp')
+    }
+
+
+def forget_thumbnails(image_name):
+    """Убрать миниатюры картинки из памяти процесса."""
+    _ready.delete(image_name)
+
+
+def prefetch_thumbnails(posts):
+    """Найти готовые миниатюры всех размеров для постов страницы.
+
+    Сначала миниатюры ищутся в LRU процесса, остальные — одним
+    пакетным запросом к хранилищу ключей sorl. Результат кладётся
+    в ``post.thumbnails``; недостающие ставятся в очередь генерации.
+    """
+    with measure('thumbnail'):
+        wanted = {}
+        for post in posts:
+            post.thumbnails = {}
+            if not post.image:
+                continue
+            ready = _ready.get(post.image.name)
+            if ready is not None:
+                post.thumbnails = ready
+                continue
+            wanted[post] = {
+                size: default.backend.thumbnail_file(post.image.name,
+                                                     geometry, **options)
+                for size, (geometry, options) in thumbnail_sizes().items()
+            }
+        if not wanted:
+            return
+        found = default.kvstore.get_many(
+            [image_file for files in wanted.values()
+             for image_file in files.values()])
+        for post, files in wanted.items():
+            post.thumbnails = {size: found[image_file.key]
+                               for size, image_file in files.items()}
+            if None in post.thumbnails.values():
+                schedule_thumbnails(post)
+            else:
+                _ready.set(post.image.name, post.thumbnails)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+        return _executor
+
+
+def render_thumbnails(image_name):
+    """Создать миниатюры всех вариантов ``thumbnail_sizes``.
+
+    Вариант, который уже рендерит другой поток, пропускается; другой
+    процесс — только при общем кэше (CACHE_LOCATION).
+    Возвращает число миниатюр, созданных этим вызовом.
+    """
+    rendered = 0
+    for size, (geometry, options) in thumbnail_sizes().items():
+        lock = THUMBNAIL_LOCK_KEY.format(image_name, size)
+        if not cache.add(lock, True, settings.THUMBNAIL_LOCK_TIMEOUT):
+            continue
+        if default.backend.get_ready_thumbnail(image_name, geometry,
+                                               **options):
+            cache.delete(lock)
+            continue
+        try:
+            default.backend.get_thumbnail(image_name, geometry, **options)
+        except Exception:
+            # Блокировка остаётся до истечения таймаута: битая картинка
+            # не будет пересобираться на каждом запросе.
+            logger.exception('Не удалось создать миниатюру %s %s',
+                             image_name, size)
+            continue
+        cache.delete(lock)
+        rendered += 1
+    return rendered
+
+
+def render_post_thumbnails(post_id):
+    """Создать миниатюры поста и сбросить закэшированные страницы с ним."""
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'group_id', 'image').first()
+    if post is None or not post.image:
+        return 0
+    rendered = render_thumbnails(post.image.name)
+    if rendered:
+        bump_generations(post_display_feeds(post))
+    return rendered
+
+
+def render_in_worker(post_id):
+    """``render_post_thumbnails`` для фонового потока."""
+    try:
+        return render_post_thumbnails(post_id)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры поста %s', post_id)
+        return 0
+    finally:
+        # Соединения с базой у каждого потока свои.
+        connections.close_all()
+
+
+def schedule_thumbnails(post):
+    """Поставить генерацию миниатюр поста в очередь после коммита.
+
+    Пост, чья генерация уже ждёт в очереди процесса, повторно
+    не ставится. При THUMBNAIL_WORKERS = 0 миниатюры создаются
+    в текущем потоке.
+    """
+    if not post.image:
+        return
+    post_id = post.pk
+    job = (post_id, post.image.name)
+
+    def finish(_=None):
+        with _pending_lock:
+            _pending.discard(job)
+
+    def submit():
+        with _pending_lock:
+            if job in _pending:
+                return
+            _pending.add(job)
+        if settings.THUMBNAIL_WORKERS:
+            future = get_executor().submit(render_in_worker, post_id)
+            future.add_done_callback(finish)
+            return
+        try:
+            render_post_thumbnails(post_id)
+        finally:
+            finish()
+
+    transaction.on_commit(submit)
@@ -1,66 +1,156 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control
 
+from core.decorators import cacheable_page
+from core.holes import personal_etag
+
+from .counters import user_stats
+from .feeds import (GENERATION_KEY, GROUPS_GENERATION, INDEX_FEED,
+                    CachedFeed, MergedFeed, feed_cache_context,
+                    follow_feed, follow_posts, followers_generation,
+                    get_generations, group_feed, post_generation,
+                    profile_feed, versioned_follow_feed, with_feed_fields)
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .paginators import CachedCountPaginator, CursorPaginator
+from .search import search_posts
+from .thumbnails import schedule_thumbnails
+
+
+def page_etag(request, *feeds):
+    """ETag страницы из поколений её лент; запоминает их для кэша страниц."""
+    feeds = [*feeds, GROUPS_GENERATION]
+    request.page_dependencies = {
+        GENERATION_KEY.format(feed): generation
+        for feed, generation in zip(feeds, get_generations(feeds))
+    }
+    return personal_etag(request, request.page_dependencies)
+
 
+def not_modified(request, etag):
+    """Ответ 304, если у клиента актуальная страница, иначе None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response = with_etag(response, etag)
+    return response
 
+
+def with_etag(response, etag):
+    response['ETag'] = etag
+    # Страница зависит от пользователя и перепроверяется при каждом показе.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@cacheable_page
 def index(request):
-    posts = Post.objects.select_related('group').all()
-    page_obj = get_paginator_page_obj(request, posts)
+    etag = page_etag(request, INDEX_FEED)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    posts = CachedFeed(INDEX_FEED, with_feed_fields(Post.objects.all()))
+    page_obj = get_paginator_page_obj(request, posts, INDEX_FEED)
     context = {
         'page_obj': page_obj,
         'follow': False,
         'index': True,
     }
-    return render(request, 'posts/index.html', context)
+    return with_etag(render(request, 'posts/index.html', context), etag)
 
 
+@cacheable_page
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_paginator_page_obj(request, posts)
+    feed = group_feed(group.pk)
+    etag = page_etag(request, feed)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    posts = CachedFeed(feed, with_feed_fields(group.posts.all()))
+    page_obj = get_paginator_page_obj(request, posts, feed)
 
-    context = {'group': group, 'page_obj': page_obj}
+    context = {
+        'group': group,
+        'page_obj': page_obj,
+    }
 
-    return render(request, 'posts/group_list.html', context)
+    return with_etag(render(request, 'posts/group_list.html', context), etag)
 
 
+@cacheable_page
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    page_obj = get_paginator_page_obj(request, posts)
-    if request.user.is_anonymous:
-        following = False
-    else:
-        following = Follow.objects.filter(user=request.user,
-                                          author=author).exists()
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    feed = profile_feed(author.pk)
+    # follow_feed автора меняется с его подписками, followers — с подписчиками.
+    etag = page_etag(request, feed, follow_feed(author.pk),
+                     followers_generation(author.pk))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    stats = user_stats(author)
+    posts = CachedFeed(feed, with_feed_fields(author.posts.all()))
+    page_obj = get_paginator_page_obj(request, posts, feed)
     context = {
         'author': author,
         'page_obj': page_obj,
-        'following': following,
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
     }
-    return render(request, 'posts/profile.html', context)
+    return with_etag(render(request, 'posts/profile.html', context), etag)
 
 
-def get_paginator_page_obj(request, posts):
-    paginator = Paginator(posts, settings.NUMBER_OF_POSTS)
+def get_paginator_page_obj(request, posts, feed=None, cursor=False):
+    cursor_requested = 'after' in request.GET or 'before' in request.GET
+    if cursor or cursor_requested or settings.CURSOR_PAGINATION:
+        paginator = CursorPaginator(posts, settings.NUMBER_OF_POSTS)
+        return paginator.get_cursor_page(after=request.GET.get('after'),
+                                         before=request.GET.get('before'))
+    paginator = CachedCountPaginator(posts, settings.NUMBER_OF_POSTS, feed)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = with_feed_fields(search_posts(query))
+    paginator = CursorPaginator(posts, settings.NUMBER_OF_POSTS,
+                                date_field='found_date', id_field='found_id')
+    page_obj = paginator.get_cursor_page(after=request.GET.get('after'),
+                                         before=request.GET.get('before'))
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@cacheable_page
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
+    # Поколение профиля меняется с числом постов автора.
+    etag = page_etag(request, post_generation(post.pk),
+                     profile_feed(post.author_id))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    comments = post.comments.select_related('author').only(
+        'text', 'post_id', 'author__username')
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
+        'posts_count': user_stats(post.author).posts_count,
         'comments': comments,
         'form': form,
+        **feed_cache_context(post_generation(post.pk)),
     }
-    return render(request, 'posts/post_page.html', context)
+    return with_etag(render(request, 'posts/post_page.html', context), etag)
 
 
 @login_required
@@ -73,6 +163,7 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        schedule_thumbnails(new_post)
         return redirect('posts:profile', username=new_post.author.username)
     return render(request, 'posts/update_post.html', {'form': form})
 
@@ -80,7 +171,7 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if request.user != post.author:
+    if request.user.pk != post.author_id:
         return redirect('posts:post', post_id)
     form = PostForm(
         request.POST or None,
@@ -89,6 +180,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         new_post = form.save()
+        if 'image' in form.changed_data:
+            schedule_thumbnails(new_post)
         return redirect('posts:post', new_post.pk)
     return render(request, 'posts/update_post.html', {'form': form})
 
@@ -107,9 +200,17 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    user = get_object_or_404(User, username=request.user)
-    posts_follower = Post.objects.filter(author__following__user=user)
-    page_obj = get_paginator_page_obj(request, posts_follower)
+    user = request.user
+    posts_follower, authors = follow_posts(user)
+    if isinstance(posts_follower, MergedFeed):
+        # Счётчик и порядок ленты с популярными авторами не кэшируются,
+        # а номер страницы стоил бы чтения всех строк до неё.
+        page_obj = get_paginator_page_obj(request, posts_follower,
+                                          cursor=True)
+    else:
+        feed = versioned_follow_feed(user.pk, authors)
+        page_obj = get_paginator_page_obj(
+            request, CachedFeed(feed, posts_follower), feed)
     context = {
         'page_obj': page_obj,
         'follow': True,
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,6 +37,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PageCacheMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
@@ -48,7 +50,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.backends.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -114,9 +116,120 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 NUMBER_OF_POSTS = 10
+# Ленты листаются по курсору (?after=/?before=) даже без токена в запросе.
+CURSOR_PAGINATION = False
+# Сколько секунд живёт закэшированное число постов ленты.
+FEED_COUNT_TIMEOUT = 60 * 60
+# Время жизни фрагментов страниц: они версионируются поколениями лент
+# и устаревают сразу после изменения постов, комментариев или групп.
+FEED_FRAGMENT_TIMEOUT = 60 * 60
+# Сколько первых id каждой ленты хранится в кэше; страницы дальше
+# читаются из базы.
+FEED_CACHED_IDS = 1000
+# Время жизни списков id лент и постов в кэше: те и другие обновляются
+# сигналами, срок лишь освобождает место от редко читаемых.
+FEED_IDS_TIMEOUT = 60 * 60
+POST_OBJECT_TIMEOUT = 60 * 60
+# Сколько последних постов хранит материализованная лента подписок.
+FEED_MAX_ENTRIES = 1000
+# Ленты обрезаются, только переросшие предел на столько записей: при
+# публикации обрезать приходится не каждую ленту подписчика.
+FEED_TRIM_SLACK = 100
+# С этого числа подписчиков посты автора подмешиваются в ленты при чтении,
+# а не раскладываются по лентам при публикации.
+FEED_PULL_THRESHOLD = 10000
+# Дальше этого числа строк админка не пересчитывает отфильтрованные списки.
+ADMIN_COUNT_LIMIT = 10000
+# Сколько секунд живёт страница в общем кэше страниц;
+# изменения видны сразу: запись сверяется с поколениями лент; 0 — без кэша.
+PAGE_CACHE_TIMEOUT = 5 * 60
+# Столько секунд после срока страница или фрагмент ещё отдаются, пока
+# один запрос их пересобирает. Смена версии так не откладывается.
+CACHE_STALE_TIMEOUT = 60
+# Дольше право на пересборку не держится, даже если запрос упал.
+CACHE_RECOMPUTE_LOCK_TIMEOUT = 10
+# Насколько заранее записи обновляются до срока (β в XFetch); 0 — в срок.
+CACHE_EARLY_REFRESH_BETA = 1.0
+# Сколько слов поискового запроса учитывается.
+SEARCH_MAX_TERMS = 8
+
+# Доля запросов с заголовком Server-Timing и строкой в логе yatube.timing.
+SERVER_TIMING_SAMPLE_RATE = env.float('SERVER_TIMING_SAMPLE_RATE', default=0)
+# Запрос с заголовком X-Server-Timing, равным этому токену, замеряется всегда.
+SERVER_TIMING_TOKEN = env('SERVER_TIMING_TOKEN', default='')
+THUMBNAIL_BACKEND = 'posts.thumbnails.PostThumbnailBackend'
+# Варианты картинки поста: имя → (геометрия, параметры sorl-thumbnail).
+# Варианты WebP пропускаются, если Pillow собран без его поддержки.
+POST_THUMBNAILS = {
+    'jpeg_480': ('480x170', {'crop': 'center', 'upscale': True,
+                             'format': 'JPEG'}),
+    'jpeg_960': ('960x339', {'crop': 'center', 'upscale': True,
+                             'format': 'JPEG'}),
+    'webp_480': ('480x170', {'crop': 'center', 'upscale': True,
+                             'format': 'WEBP'}),
+    'webp_960': ('960x339', {'crop': 'center', 'upscale': True,
+                             'format': 'WEBP'}),
+}
+# Вариант для атрибута src.
+POST_THUMBNAIL_FALLBACK = 'jpeg_960'
+# Атрибут sizes: ширина картинки поста на экранах разной ширины.
+POST_IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+# Потоков фоновой генерации миниатюр; 0 — создавать сразу после коммита.
+THUMBNAIL_WORKERS = env.int('THUMBNAIL_WORKERS', default=2)
+# Сколько держится блокировка генерации одной миниатюры.
+THUMBNAIL_LOCK_TIMEOUT = 60
+THUMBNAIL_KVSTORE = 'posts.thumbnails.KVStore'
+# Сколько картинок с готовыми миниатюрами помнит каждый процесс.
+THUMBNAIL_LRU_SIZE = 1024
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Файл общего для всех процессов кэша на SQLite (core.cache.SQLiteCache).
+# Без него у каждого процесса свой LocMemCache: блокировки миниатюр,
+# счётчики и поколения лент не действуют между процессами, поэтому при
+# нескольких процессах он обязателен (manage.py check --deploy).
+CACHE_LOCATION = env('CACHE_LOCATION', default='')
+if CACHE_LOCATION:
+    CACHES = {
+        # Горячие ключи читаются из памяти процесса, остальные — из
+        # общего для процессов кэша 'shared'.
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'L1_MAX_ENTRIES': env.int('CACHE_L1_MAX_ENTRIES',
+                                          default=300),
+                # Блокировки пересборок и миниатюр не читаются через L1.
+                'L2_ONLY_PREFIXES': ('recompute:', 'thumbnail_lock:'),
+            },
+        },
+        'shared': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': CACHE_LOCATION,
+            'OPTIONS': {
+                'MAX_ENTRIES': env.int('CACHE_MAX_ENTRIES', default=100000),
+                'MAX_SIZE': env.int('CACHE_MAX_SIZE', default=256 * 2 ** 20),
+            },
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}